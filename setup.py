@@ -4,6 +4,7 @@ from setuptools import setup, find_packages
 # -- Python Dependencies -- #
 dependencies = [
     "pyuit",
+    "orjson",
 ]
 
 setup(
@@ -6,7 +6,7 @@
 set -e
 rm -f .coverage
 echo "Running Unit Tests..."
-coverage run -a --rcfile=coverage.ini -m unittest -v uit_plus_job.tests.unit_tests.test_oauth2
+coverage run -a --rcfile=coverage.ini -m unittest -v uit_plus_job.tests.unit_tests.test_oauth2 uit_plus_job.tests.unit_tests.test_util
 
 echo "Unit Tests Coverage Report..."
 coverage report -m
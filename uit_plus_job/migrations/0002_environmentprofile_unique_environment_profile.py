@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+def _unique_profile_name(profile, taken):
+    """Append the primary key to a duplicate profile name, and a counter if that name is also taken."""
+    suffix = f" ({profile.pk})"
+    count = 1
+    while True:
+        name = profile.name[: 64 - len(suffix)] + suffix
+        if (profile.user_id, profile.hpc_system, profile.software, name) not in taken:
+            return name
+        count += 1
+        suffix = f" ({profile.pk}-{count})"
+
+
+def rename_duplicate_profiles(apps, schema_editor):
+    """Rename duplicate profiles so the unique constraint can be applied without losing data."""
+    EnvironmentProfile = apps.get_model("uit_plus_job", "EnvironmentProfile")
+    profiles = list(EnvironmentProfile.objects.order_by("pk"))
+    # Include the names of profiles not reached yet so a new name can't clash with one of them
+    taken = {(p.user_id, p.hpc_system, p.software, p.name) for p in profiles}
+    seen = set()
+    for profile in profiles:
+        key = (profile.user_id, profile.hpc_system, profile.software, profile.name)
+        if key in seen:
+            profile.name = _unique_profile_name(profile, taken)
+            profile.save(update_fields=["name"])
+            key = (profile.user_id, profile.hpc_system, profile.software, profile.name)
+            taken.add(key)
+        seen.add(key)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("uit_plus_job", "0001_initial_41"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(rename_duplicate_profiles, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="environmentprofile",
+            constraint=models.UniqueConstraint(
+                fields=("user", "hpc_system", "software", "name"),
+                name="unique_environment_profile",
+            ),
+        ),
+    ]
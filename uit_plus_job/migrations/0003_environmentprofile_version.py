@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("uit_plus_job", "0002_environmentprofile_unique_environment_profile"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="environmentprofile",
+            name="version",
+            field=models.CharField(db_index=True, max_length=1024, null=True),
+        ),
+    ]
@@ -10,10 +10,11 @@ import logging
 import datetime as dt
 from collections import OrderedDict
 from pathlib import Path, PurePosixPath
-from functools import partial, wraps
+from functools import cached_property, partial, wraps
 
+import orjson
 from channels.db import database_sync_to_async
-from django.db import models
+from django.db import connections, models
 from django.utils import timezone
 from django.db.models import JSONField
 from django.contrib.auth.models import User
@@ -895,6 +896,7 @@ class EnvironmentProfile(models.Model):
         hpc_system (str): The name of the hpc system the profile was created for (e.g. "onyx")
         environment_variables (str): A Json string of the environment variables
         modules (str): A Json string of the modules to load and unload
+        version (str): The software version the profile's environment variables were saved for
         last_used (datetime): The time the profile was last loaded (for sorting)
     """
 
@@ -905,10 +907,24 @@ class EnvironmentProfile(models.Model):
     email = models.CharField(max_length=1024, null=True)
     environment_variables = models.CharField(max_length=2048, null=True)
     modules = JSONField(default=dict, null=True)
+    version = models.CharField(max_length=1024, null=True, db_index=True)
     last_used = models.DateTimeField(auto_now_add=True)
     user_default = models.BooleanField(default=False)
     default_for_versions = JSONField(blank=True, default=list, null=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "hpc_system", "software", "name"],
+                name="unique_environment_profile",
+            ),
+        ]
+
+    @cached_property
+    def env_vars_parsed(self):
+        """OrderedDict: The environment variables parsed from the stored Json string."""
+        return OrderedDict(orjson.loads(self.environment_variables or "{}"))
+
     @classmethod
     def set_default_for_version(cls, usr, profile, version):
         """Set profile as the default for the selected version.
@@ -992,10 +1008,12 @@ class EnvironmentProfile(models.Model):
         Returns:
 
         """
-        profiles = cls.objects.filter(user=usr, hpc_system=hpc_system, software=software).exclude(
-            default_for_versions=[]
-        )
-        for profile in profiles:
+        profiles = cls.objects.filter(user=usr, hpc_system=hpc_system, software=software)
+        if connections[profiles.db].features.supports_json_field_contains:
+            return profiles.filter(default_for_versions__contains=[version]).first()
+
+        # Backends such as SQLite and Oracle can't query JSON containment, so check the lists in Python
+        for profile in profiles.exclude(default_for_versions=[]):
             if version in profile.default_for_versions:
                 return profile
 
@@ -1011,14 +1029,7 @@ class EnvironmentProfile(models.Model):
         Returns:
 
         """
-        try:
-            profiles = cls.objects.get(user=usr, hpc_system=hpc_system, software=software, user_default=True)
-        except cls.DoesNotExist:
-            return None
-        except cls.MultipleObjectsReturned:
-            return cls.objects.filter(user=usr, hpc_system=hpc_system, software=software, user_default=True)[0]
-
-        return profiles
+        return cls.objects.filter(user=usr, hpc_system=hpc_system, software=software, user_default=True).first()
 
     def is_default_for_version(self, version):
         """Return True if this profile is the default profile for the included version.
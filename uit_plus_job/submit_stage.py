@@ -1,14 +1,17 @@
+import asyncio
 from collections import OrderedDict
-import json
 import logging
-import re
 
+import orjson
 import param
 import panel as pn
 
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
 from channels.db import database_sync_to_async
 from uit_plus_job.models import UitPlusJob, EnvironmentProfile
+from uit_plus_job.util import scan_pbs_script
 from uit.gui_tools.submit import HpcSubmit, PbsScriptAdvancedInputs
 from uit.gui_tools import FileSelector, HpcFileBrowser, get_js_loading_code
 
@@ -17,6 +20,8 @@ log = logging.getLogger(__name__)
 
 
 class TethysProfileManagement(PbsScriptAdvancedInputs):
+    _LT_NEW, _LT_SAVED, _LT_PBS = "Create New Profile", "Load Saved Profile", "Load Profile from PBS Script"
+
     tethys_user = param.ClassSelector(class_=User)
     environment_profile = param.Selector(label="Load Environment Profile")
     environment_profile_delete = param.Selector(label="Environment Profile to Delete")
@@ -32,12 +37,8 @@ class TethysProfileManagement(PbsScriptAdvancedInputs):
     notification_email = param.String(label="Notification E-mail")
     selected_version = param.String()
     load_type = param.Selector(
-        default="Load Saved Profile",
-        objects=[
-            "Create New Profile",
-            "Load Saved Profile",
-            "Load Profile from PBS Script",
-        ],
+        default=_LT_SAVED,
+        objects=[_LT_NEW, _LT_SAVED, _LT_PBS],
     )
     pbs_body = param.String()
     _software_versions = param.List()
@@ -48,8 +49,16 @@ class TethysProfileManagement(PbsScriptAdvancedInputs):
     def __init__(self, *args, **kwargs):
         self.revert_btn = pn.widgets.Button(name="Revert", button_type="primary", width=100)
         self.revert_btn.on_click(self.revert)
+        self._init_panel_buttons()
         self.overwrite_request = None
+        self._versions_cache = {}
+        self._default_profile_cache = {}
+        self._profiles_cache = {}
+        self._profile_by_name = {}
+        self._currently_loaded_profile = None
+        self._select_profile_cb = None
         self.cb = None
+        self._pbs_scan_cache = None
         self.count = 0
         self.progress_bar = pn.widgets.misc.Progress(width=250, active=False, visible=False)
         self.alert = pn.pane.Alert(visible=False)
@@ -91,8 +100,11 @@ class TethysProfileManagement(PbsScriptAdvancedInputs):
         return self._software_versions
 
     async def get_cached_versions(self, update_cache=False):
-        if not self._software_versions or update_cache:
-            self._software_versions = await self.await_if_async(self.get_versions())
+        # Versions are looked up on the HPC, so keep them for each system the client connects to
+        key = (self.uit_client.system, self.software)
+        if key not in self._versions_cache or update_cache:
+            self._versions_cache[key] = await self.await_if_async(self.get_versions())
+        self._software_versions = self._versions_cache[key]
         return self._software_versions
 
     @param.depends(
@@ -120,8 +132,9 @@ class TethysProfileManagement(PbsScriptAdvancedInputs):
             help_text="Load environment from a PBS file",
         )
         select_pbs.param.watch(self._parse_remote_pbs, "file_path")
-        select_pbs.file_browser = HpcFileBrowser(self.uit_client, delayed_init=False, patterns=["*.pbs", "*.sh"])
-        select_pbs.show_browser = True
+        # The HPC file browser is only created once the user chooses to select a script on the HPC
+        self._pbs_selector = select_pbs
+        pbs_script_type.param.watch(self._init_pbs_file_browser, "value")
         fbp = select_pbs.panel
         fbp.visible = False
 
@@ -171,20 +184,64 @@ class TethysProfileManagement(PbsScriptAdvancedInputs):
             width=800,
         )
 
+    def _init_pbs_file_browser(self, e):
+        if e.new == "Select Script on HPC" and not isinstance(self._pbs_selector.file_browser, HpcFileBrowser):
+            self._pbs_selector.file_browser = HpcFileBrowser(
+                self.uit_client, delayed_init=False, patterns=["*.pbs", "*.sh"]
+            )
+            self._pbs_selector.show_browser = True
+
     @database_sync_to_async
-    def get_profiles(self, version=None):
+    def get_profiles(self, version=None, include_meta=False):
         kwargs = dict(
             user=self.tethys_user,
             hpc_system=self.uit_client.system,
             software=self.software,
         )
+        profiles = EnvironmentProfile.objects.filter(**kwargs).order_by("name")
         if version is not None:
-            kwargs["environment_variables__contains"] = f'"{self.version_environment_variable}": "{version}"'
+            # Profiles saved before the version column existed only record the version in their environment variables
+            legacy_version = f'"{self.version_environment_variable}": "{version}"'
+            profiles = profiles.filter(
+                Q(version=version) | Q(version__isnull=True, environment_variables__contains=legacy_version)
+            )
 
-        return sorted([p.name for p in EnvironmentProfile.objects.filter(**kwargs)])
+        if include_meta:
+            # Keep the loaded profiles so version lists and lookups by name don't need another query
+            by_name = {p.name: p for p in profiles.iterator(chunk_size=500)}
+            self._profile_by_name[(self.uit_client.system, self.software)] = by_name
+            return list(by_name)
+
+        cache_key = (self.uit_client.system, self.software, version)
+        if cache_key not in self._profiles_cache:
+            names = profiles.values_list("name", flat=True)
+            self._profiles_cache[cache_key] = list(names.iterator(chunk_size=500))
+        return self._profiles_cache[cache_key]
+
+    def _filter_cached_profiles(self, version=None):
+        """Filter the profiles cached by get_profiles(include_meta=True) by version."""
+        by_name = self._cached_profiles_by_name()
+        if version is None:
+            return list(by_name)
+
+        profiles = []
+        for name, profile in by_name.items():
+            profile_version = profile.version
+            if profile_version is None:
+                profile_version = profile.env_vars_parsed.get(self.version_environment_variable)
+            if profile_version == version:
+                profiles.append(name)
+        return profiles
+
+    def _cached_profiles_by_name(self):
+        """Return the profiles cached by get_profiles(include_meta=True) for the current system, if any."""
+        return self._profile_by_name.get((self.uit_client.system, self.software))
 
     @database_sync_to_async
     def get_profile(self, name):
+        by_name = self._cached_profiles_by_name()
+        if by_name is not None and name in by_name:
+            return by_name[name]
         return EnvironmentProfile.objects.get(
             user=self.tethys_user,
             hpc_system=self.uit_client.system,
@@ -192,8 +249,14 @@ class TethysProfileManagement(PbsScriptAdvancedInputs):
             name=name,
         )
 
+    async def get_default_profile(self, version=None, use_general_default=False):
+        key = (self.uit_client.system, self.software, version, use_general_default)
+        if key not in self._default_profile_cache:
+            self._default_profile_cache[key] = await self._get_default_profile(version, use_general_default)
+        return self._default_profile_cache[key]
+
     @database_sync_to_async
-    def get_default_profile(self, version=None, use_general_default=False):
+    def _get_default_profile(self, version, use_general_default):
         return EnvironmentProfile.get_default(
             self.tethys_user,
             self.uit_client.system,
@@ -202,8 +265,16 @@ class TethysProfileManagement(PbsScriptAdvancedInputs):
             use_general_default=use_general_default,
         )
 
+    def _invalidate_profile_caches(self):
+        """Clear cached profile lookups so they are re-queried after profiles change."""
+        self._default_profile_cache.clear()
+        self._profiles_cache.clear()
+        self._profile_by_name.clear()
+
     @param.depends("uit_client", watch=True)
     async def update_uit_dependant_options(self):
+        # Profiles are saved per system, so lookups made with the previous client no longer apply
+        self._invalidate_profile_caches()
         versions = await self.get_cached_versions()
         self.param.version.objects = ["System Default"] + versions
         self.version = self.version or "System Default"
@@ -212,16 +283,18 @@ class TethysProfileManagement(PbsScriptAdvancedInputs):
     @param.depends("version", watch=True)
     async def update_version_profiles(self):
         version = None if self.version == "System Default" else self.version
-        profiles = await self.get_profiles(version=version)
+        await self._refresh_profile_list(version)
         version_default = await self.get_default_profile(version=self.version, use_general_default=version is None)
+        self._refresh_default_marker(version_default)
+
+    async def _refresh_profile_list(self, version):
+        """Update the profiles listed for the selected version."""
+        if self._cached_profiles_by_name() is not None:
+            profiles = self._filter_cached_profiles(version=version)
+        else:
+            profiles = await self.get_profiles(version=version)
 
         self.param.environment_profile_version.objects = profiles
-        if version_default:
-            self.initializing_environment_profile_version = True
-            trigger = self.environment_profile_version == version_default.name
-            self.environment_profile_version = version_default.name
-            if trigger:  # always trigger event even if value doesn't change
-                self.param.trigger("environment_profile_version")
         if profiles:
             self.param.environment_profile_version.precedence = 2
             self.no_version_profiles_alert.visible = False
@@ -229,8 +302,17 @@ class TethysProfileManagement(PbsScriptAdvancedInputs):
             self.param.environment_profile_version.precedence = -1
             self.no_version_profiles_alert.visible = True
 
+    def _refresh_default_marker(self, version_default):
+        """Mark the default profile for the selected version without saving it as a new default."""
+        if version_default:
+            self.initializing_environment_profile_version = True
+            trigger = self.environment_profile_version == version_default.name
+            self.environment_profile_version = version_default.name
+            if trigger:  # always trigger event even if value doesn't change
+                self.param.trigger("environment_profile_version")
+
     def update_save_panel(self, e):
-        self.save_name = self.environment_profile if self.load_type == self.param.load_type.objects[1] else ""
+        self.save_name = self.environment_profile if self.load_type == self._LT_SAVED else ""
         self.show_save_panel = True
 
     def update_delete_panel(self, should_show):
@@ -246,11 +328,14 @@ class TethysProfileManagement(PbsScriptAdvancedInputs):
 
     @param.depends("load_type", watch=True)
     async def revert(self, e=None):
-        if self.load_type == self.param.load_type.objects[0]:
+        if self.load_type == self._LT_NEW:
             await self.update_configurable_hpc_parameters(reset=True)
-        elif self.load_type == self.param.load_type.objects[1]:
+        elif self.load_type == self._LT_SAVED:
+            self._currently_loaded_profile = None  # force the saved values to be reloaded
+            # Load now instead of when a pending selection fires, so it can't reload the profile afterwards
+            self._cancel_select_profile()
             await self.select_profile()
-        elif self.load_type == self.param.load_type.objects[2]:
+        elif self.load_type == self._LT_PBS:
             self._populate_from_pbs()
         self.reset_loading()
         self.param.trigger("show_save_panel")
@@ -269,11 +354,31 @@ class TethysProfileManagement(PbsScriptAdvancedInputs):
             return
         profile = await self.get_profile(name=self.environment_profile_version)
         await self._set_profile_default(profile)
+        # Only the default changed and it is already selected, so the profile list doesn't need to be refreshed.
+        # The previous default was updated through a separate instance, so drop the cached instances.
+        self._default_profile_cache.clear()
+        self._profile_by_name.clear()
         self._alert(f"Default profile for version {self.version} is now set to {self.environment_profile_version}")
-        self.update_version_profiles()
 
     @param.depends("environment_profile", watch=True)
+    def schedule_select_profile(self):
+        # Only load the last profile selected within the throttle period
+        self._cancel_select_profile()
+        # Setting the profile that is already loaded (e.g. while populating it) has nothing to load,
+        # but the browser still put the panel in the loading state when it was selected
+        if self.environment_profile == self._currently_loaded_profile:
+            self._reset_profile_panel_loading()
+            return
+        self._select_profile_cb = pn.state.add_periodic_callback(self.select_profile, period=200, count=1)
+
+    def _cancel_select_profile(self):
+        """Stop a profile load scheduled by schedule_select_profile that hasn't run yet."""
+        if self._select_profile_cb is not None:
+            self._select_profile_cb.stop()
+            self._select_profile_cb = None
+
     async def select_profile(self):
+        self._select_profile_cb = None
         if self.environment_profile and not self.environment_profile == "default":
             await self._populate_profile_from_saved(self.environment_profile)
 
@@ -283,6 +388,23 @@ class TethysProfileManagement(PbsScriptAdvancedInputs):
         profile.save()
         return profile
 
+    @database_sync_to_async
+    def _get_or_create_profile(self, name, defaults):
+        with transaction.atomic():
+            profile, _ = EnvironmentProfile.objects.get_or_create(
+                user=self.tethys_user,
+                hpc_system=self.uit_client.system,
+                software=self.software,
+                name=name,
+                defaults=defaults,
+            )
+        return profile
+
+    @database_sync_to_async
+    def _update_profile(self, profile, update_fields=None):
+        profile.save(update_fields=update_fields)
+        return profile
+
     @database_sync_to_async
     def _delete_profile(self, profile):
         profile.delete()
@@ -292,39 +414,42 @@ class TethysProfileManagement(PbsScriptAdvancedInputs):
         Get a list of profiles from the database
         that belong to this user
         """
-        profiles = await self.get_profiles()
+        self._invalidate_profile_caches()
+        profiles = await self.get_profiles(include_meta=True)
 
         # Create default profile for user if one does not exist
         if len(profiles) == 0:
             log.info("Creating default profile")
-            self.update_configurable_hpc_parameters(reset=True)
-            env_var_json = json.dumps(self.environment_variables)
+            await self.update_configurable_hpc_parameters(reset=True)
+            env_var_json = orjson.dumps(self.environment_variables).decode()
             modules = {
                 "modules_to_load": self.modules_to_load,
                 "modules_to_unload": self.modules_to_unload,
             }
 
-            saving_profile = await self._save_profile(
-                user=self.tethys_user,
-                environment_variables=env_var_json,
-                modules=modules,
-                hpc_system=self.uit_client.system,
-                software=self.software,
+            await self._get_or_create_profile(
                 name="system-default",
-                default_for_versions=[],
-                user_default=True,
+                defaults=dict(
+                    environment_variables=env_var_json,
+                    modules=modules,
+                    version=self.environment_variables.get(self.version_environment_variable),
+                    default_for_versions=[],
+                    user_default=True,
+                ),
             )
-            profiles = [saving_profile.name]
+            # Another session may have created profiles concurrently, so re-read the list
+            profiles = await self.get_profiles(include_meta=True)
 
         self.profiles = profiles
         self.param.environment_profile.objects = self.param.environment_profile_delete.objects = self.profiles
         for attr in ["environment_profile", "environment_profile_delete"]:
             if getattr(self, attr) not in self.profiles:
                 setattr(self, attr, self.profiles[0])
-        self.update_version_profiles()
+        await self.update_version_profiles()
 
     async def _delete_selected_profile(self, e=None):
         log.info("Deleting profile {}".format(self.environment_profile_delete))
+        self._currently_loaded_profile = None
 
         del_profile = await self.get_profile(name=self.environment_profile_delete)
 
@@ -337,8 +462,9 @@ class TethysProfileManagement(PbsScriptAdvancedInputs):
 
     async def _save_current_profile(self, e=None):
         log.info("Saving profile")
+        self._currently_loaded_profile = None
 
-        env_var_json = json.dumps(self.environment_variables)
+        env_var_json = orjson.dumps(self.environment_variables).decode()
         modules = {
             "modules_to_load": self.modules_to_load,
             "modules_to_unload": self.modules_to_unload,
@@ -361,6 +487,10 @@ class TethysProfileManagement(PbsScriptAdvancedInputs):
             saving_profile.modules = modules
             saving_profile.environment_variables = env_var_json
             saving_profile.email = self.notification_email
+            saving_profile.version = self.environment_variables.get(self.version_environment_variable)
+            await self._update_profile(
+                saving_profile, update_fields=["modules", "environment_variables", "email", "version"]
+            )
             self.overwrite_request = None
         else:
             # Check to see if a profile already exists for this user with the same name
@@ -391,137 +521,129 @@ class TethysProfileManagement(PbsScriptAdvancedInputs):
                     software=self.software,
                     name=self.save_name,
                     email=self.notification_email,
+                    version=version,
                     default_for_versions=default_for_versions,
                 )
         await self._load_profiles()
         self.environment_profile = self.save_name
-        self.load_type = self.param.load_type.objects[1]
+        self.load_type = self._LT_SAVED
         self._alert("Successfully saved.", alert_type="success")
         self.cancel_save()
 
     def _alert(self, message, alert_type="info", timeout=True):
-        self._clear_alert()
-        self.alert.visible = True
-        self.close_alert_button.visible = True
         self.alert.alert_type = alert_type
         self.alert.object = message
+        self._set_alert_visibility(True)
 
     def _clear_alert(self, e=None):
-        self.alert.visible = False
-        self.close_alert_button.visible = False
+        self._set_alert_visibility(False)
         self.alert.object = ""
 
+    def _set_alert_visibility(self, visible):
+        """Show or hide the alert panes, only updating those whose visibility actually changes."""
+        for pane in (self.alert, self.close_alert_button):
+            if pane.visible != visible:
+                pane.visible = visible
+
+    def _scan_pbs_body(self):
+        """
+        Parse the modules, environment variables and directives
+        from pbs file contents in a single pass, reusing the result
+        until the contents change.
+
+        Returns copies of the cached result so callers can modify them.
+        """
+        pbs_body = self.pbs_body
+        if self._pbs_scan_cache is None or self._pbs_scan_cache[0] != pbs_body:
+            self._pbs_scan_cache = (pbs_body, scan_pbs_script(pbs_body))
+
+        parsed_body, directives = self._pbs_scan_cache[1]
+        return (
+            {k: v.copy() for k, v in parsed_body.items()},
+            {k: v.copy() if isinstance(v, dict) else v for k, v in directives.items()},
+        )
+
     def _parse_pbs_body(self):
         """
         return the modules and environment
         variables parsed from pbs file contents.
         """
-        tokenize = [line.rstrip().split() for line in self.pbs_body.splitlines()]
-
-        modules_to_load = []
-        modules_to_unload = []
-
-        env_vars = {}
-
-        for line in tokenize:
-            # Get modules
-            if len(line) > 2 and line[0] == "module":
-
-                if line[1] == "load":
-                    modules_to_load.extend(line[2:])
-                elif line[1] == "unload":
-                    modules_to_unload.extend(line[2:])
-                elif line[1] == "swap" and len(line) > 3:
-                    modules_to_unload.append(line[2])
-                    modules_to_load.append(line[3])
-
-            # Get environment variables
-            if len(line) > 1:
-                # parse BASH scripts
-                if line[0] == "export":
-                    # Add environment variable
-                    var_name = line[1].split("=")[0]
-                    # Refuse everything to the right of the first equals sign
-                    value = "=".join(line[1].split("=")[1:])
-                    env_vars[var_name] = value
-
-                # parse CSH scripts
-                if line[0] == "setenv":
-                    # Add environment variable
-                    var_name = line[1]
-                    env_vars[var_name] = line[2]
-
-        return {
-            "modules_to_load": modules_to_load,
-            "modules_to_unload": modules_to_unload,
-            "environment_variables": env_vars,
-        }
+        return self._scan_pbs_body()[0]
 
     def _parse_pbs_directives(self):
         """
         Returns a dictionary of the directives
         specified in a PBS script
         """
-        # Get general directives
-        matches = re.findall("#PBS -(.*)", self.pbs_body)
-        directives = {k: v for k, v in [(i.split() + [""])[:2] for i in matches]}
-        # Get l directives
-        l_matches = re.findall("#PBS -l (.*)", self.pbs_body)
-        d = dict()
-        for match in l_matches:
-            if "walltime" in match:
-                d["walltime"] = match.split("=")[1]
-            else:
-                d.update({k: v for k, v in [i.split("=") for i in l_matches[0].split(":")]})
-
-        directives["l"] = d
-        return directives
+        return self._scan_pbs_body()[1]
 
     async def _populate_profile_from_saved(self, name):
         """
         Load profile from db and populate params
         """
+        # Leave the revert button alone so edits made to the loaded profile can still be reverted
+        if name == self._currently_loaded_profile:
+            self._reset_profile_panel_loading()
+            return
+
         profile = await self.get_profile(name=name)
 
         if not profile:
             raise ValueError("Trying to load profile that doesn't exist.")
 
-        self.environment_profile = profile.name
+        # Set before updating environment_profile so the schedule_select_profile watcher doesn't load it a second time
+        self._currently_loaded_profile = profile.name
         modules = profile.modules
-        self.modules_to_load = modules["modules_to_load"]
-        self.modules_to_unload = modules["modules_to_unload"]
-        self.environment_variables = OrderedDict(json.loads(profile.environment_variables))
-        self.notification_email = profile.email or ""
+        with param.parameterized.batch_call_watchers(self):
+            self.environment_profile = profile.name
+            self.modules_to_load = list(modules["modules_to_load"])
+            self.modules_to_unload = list(modules["modules_to_unload"])
+            self.environment_variables = OrderedDict(profile.env_vars_parsed)
+            self.notification_email = profile.email or ""
         self.reset_loading()
 
     def _parse_local_pbs(self, e):
         self.pbs_body = str(e.new.decode("ascii"))
         self._populate_from_pbs()
 
-    def _parse_remote_pbs(self, e):
+    async def _parse_remote_pbs(self, e):
         pbs_file_path = e.obj.file_path or ""
         if pbs_file_path.endswith(".pbs") or pbs_file_path.endswith(".sh"):
-            self.pbs_body = self.uit_client.call(f"cat {pbs_file_path}")
+            command = f"cat {pbs_file_path}"
+            if asyncio.iscoroutinefunction(self.uit_client.call):
+                self.pbs_body = await self.uit_client.call(command)
+            else:
+                # Keep the event loop responsive while a synchronous client fetches the file
+                self.pbs_body = await asyncio.to_thread(self.uit_client.call, command)
             self._populate_from_pbs()
             e.obj.show_browser = False
 
     def _populate_from_pbs(self):
         parsed_pbs = self._parse_pbs_body()
-        self.modules_to_load = self._validate_modules(self.param.modules_to_load.objects, parsed_pbs["modules_to_load"])
-        self.modules_to_unload = self._validate_modules(
-            self.param.modules_to_unload.objects, parsed_pbs["modules_to_unload"]
-        )
-
         new_env_vars = OrderedDict()
         for k, v in parsed_pbs["environment_variables"].items():
             new_env_vars[k] = v.strip('"')
-        self.environment_variables = new_env_vars
+
+        with param.parameterized.batch_call_watchers(self):
+            self.modules_to_load = self._validate_modules(
+                self.param.modules_to_load.objects, parsed_pbs["modules_to_load"]
+            )
+            self.modules_to_unload = self._validate_modules(
+                self.param.modules_to_unload.objects, parsed_pbs["modules_to_unload"]
+            )
+            self.environment_variables = new_env_vars
         self.reset_loading()
 
     def reset_loading(self):
         self.revert_btn.disabled = True
-        self.profile_panel.css_classes = ["temp"]
-        self.profile_panel.css_classes = []
+        self._reset_profile_panel_loading()
+
+    def _reset_profile_panel_loading(self):
+        """Clear the loading state the browser applied to the profile panel when a profile was selected."""
+        # hold the document so the css toggle reaches the browser as a single change
+        with pn.io.hold():
+            self.profile_panel.css_classes = ["temp"]
+            self.profile_panel.css_classes = []
 
     def profile_management_panel(self):
         return pn.Row(
@@ -543,70 +665,82 @@ class TethysProfileManagement(PbsScriptAdvancedInputs):
             self.delete_panel,
         )
 
+    def _init_panel_buttons(self):
+        """Create the delete and save panel buttons once so toggling the panels only rearranges them."""
+        self._show_delete_btn = pn.widgets.Button(name="Delete Selected Profile", button_type="danger", width=200)
+        self._show_delete_btn.on_click(lambda e: self.update_delete_panel(True))
+        self._delete_btn = pn.widgets.Button(name="Delete", button_type="danger", width=100)
+        self._delete_btn.on_click(self._delete_selected_profile)
+        self._cancel_delete_btn = pn.widgets.Button(name="Cancel", button_type="primary", width=100)
+        self._cancel_delete_btn.on_click(lambda e: self.update_delete_panel(False))
+
+        self._show_save_btn = pn.widgets.Button(name="Save Current Profile", button_type="success", width=200)
+        self._show_save_btn.on_click(self.update_save_panel)
+        self._save_btn = pn.widgets.Button(name="Save", button_type="success", width=100)
+        self._save_btn.on_click(self._save_current_profile)
+        self._cancel_save_btn = pn.widgets.Button(name="Cancel", button_type="danger", width=100)
+        self._cancel_save_btn.on_click(self.cancel_save)
+
+        code = get_js_loading_code("btn")
+        self._show_delete_btn.js_on_click(args={"btn": self._show_delete_btn}, code=code)
+        self._show_save_btn.js_on_click(args={"btn": self._show_save_btn, "o": self.revert_btn}, code=code)
+        self.revert_btn.js_on_click(args={"btn": self.revert_btn, "o": self._show_save_btn}, code=code)
+
+        code = f"o.disabled=true; {code}"
+        for btn, other in (
+            (self._delete_btn, self._cancel_delete_btn),
+            (self._cancel_delete_btn, self._delete_btn),
+            (self._save_btn, self._cancel_save_btn),
+            (self._cancel_save_btn, self._save_btn),
+        ):
+            btn.js_on_click(args={"btn": btn, "o": other}, code=code)
+
+    @staticmethod
+    def _reset_buttons(*buttons):
+        """Clear the loading state the browser applied to buttons when they were last clicked."""
+        # the browser changed these without the server knowing, so toggle them to force a sync
+        with pn.io.hold():
+            for btn in buttons:
+                btn.css_classes = ["temp"]
+                btn.css_classes = []
+                btn.disabled = True
+                btn.disabled = False
+
     @param.depends("show_delete_panel")
     def delete_panel(self):
         if self.show_delete_panel:
-            delete_btn = pn.widgets.Button(name="Delete", button_type="danger", width=100)
-            delete_btn.on_click(self._delete_selected_profile)
-            cancel_btn = pn.widgets.Button(name="Cancel", button_type="primary", width=100)
-            cancel_btn.on_click(lambda e: self.update_delete_panel(False))
-
-            code = f"o.disabled=true; {get_js_loading_code('btn')}"
-
-            delete_btn.js_on_click(args={"btn": delete_btn, "o": cancel_btn}, code=code)
-            cancel_btn.js_on_click(args={"btn": cancel_btn, "o": delete_btn}, code=code)
-
+            self._reset_buttons(self._delete_btn, self._cancel_delete_btn)
             return pn.Column(
                 self.param.environment_profile_delete,
                 pn.pane.Alert(
                     "Are you sure you want to delete the selected profile? This action cannot be undone.",
                     alert_type="danger",
                 ),
-                pn.Row(delete_btn, cancel_btn, align="end"),
+                pn.Row(self._delete_btn, self._cancel_delete_btn, align="end"),
             )
         else:
-            delete_btn = pn.widgets.Button(name="Delete Selected Profile", button_type="danger", width=200)
-            delete_btn.on_click(lambda e: self.update_delete_panel(True))
-            code = get_js_loading_code("btn")
-            delete_btn.js_on_click(args={"btn": delete_btn}, code=code)
-
-            return pn.Column(self.param.environment_profile_delete, pn.Row(delete_btn, align="end"))
+            self._reset_buttons(self._show_delete_btn)
+            return pn.Column(self.param.environment_profile_delete, pn.Row(self._show_delete_btn, align="end"))
 
     @param.depends("show_save_panel")
     def save_panel(self):
         if self.show_save_panel:
-            save_btn = pn.widgets.Button(name="Save", button_type="success", width=100)
-            save_btn.on_click(self._save_current_profile)
-            cancel_btn = pn.widgets.Button(name="Cancel", button_type="danger", width=100)
-            cancel_btn.on_click(self.cancel_save)
-
-            code = f"o.disabled=true; {get_js_loading_code('btn')}"
-
-            save_btn.js_on_click(args={"btn": save_btn, "o": cancel_btn}, code=code)
-            cancel_btn.js_on_click(args={"btn": cancel_btn, "o": save_btn}, code=code)
-
+            self._reset_buttons(self._save_btn, self._cancel_save_btn)
             return pn.Column(
                 pn.Column(
                     self.param.save_name,
-                    pn.Row(save_btn, cancel_btn, align="end"),
+                    pn.Row(self._save_btn, self._cancel_save_btn, align="end"),
                     align="end",
                 ),
                 sizing_mode="stretch_width",
             )
         else:
-            self.revert_btn.css_classes = ["temp"]
-            self.revert_btn.css_classes = []
-
-            save_btn = pn.widgets.Button(name="Save Current Profile", button_type="success", width=200)
-            save_btn.on_click(self.update_save_panel)
-
-            code = get_js_loading_code("btn")
-
-            save_btn.js_on_click(args={"btn": save_btn, "o": self.revert_btn}, code=code)
-            self.revert_btn.js_on_click(args={"btn": self.revert_btn, "o": save_btn}, code=code)
-
+            self._reset_buttons(self._show_save_btn)
+            with pn.io.hold():
+                self.revert_btn.css_classes = ["temp"]
+                self.revert_btn.css_classes = []
             return pn.Column(
-                pn.Row(save_btn, self.revert_btn, align="end"),
+                pn.Row(self._show_save_btn, self.revert_btn, align="end"),
                 sizing_mode="stretch_width",
             )
 
@@ -676,20 +810,24 @@ class TethysHpcSubmit(HpcSubmit, TethysProfileManagement):
         self.validate_version()
 
     def _populate_from_pbs(self):
-        super()._populate_from_pbs()
-
-        # Load directives
-        directives = self._parse_pbs_directives()
-        self.hpc_subproject = directives.get("A") or self.hpc_subproject
-        if directives.get("l"):
-            self.nodes = int(directives["l"]["select"])
-            self.processes_per_node = int(directives["l"]["ncpus"])
-            self.wall_time = directives["l"]["walltime"]
-        self.queue = directives.get("q") or self.queue
-        self.notification_email = directives.get("M") or self.notification_email
-        if directives.get("m"):
-            self.notify_start = "b" in directives["m"]
-            self.notify_end = "e" in directives["m"]
+        # Queue watchers so they fire once after all parameters are updated
+        with param.parameterized.batch_call_watchers(self):
+            super()._populate_from_pbs()
+
+            # Load directives
+            directives = self._parse_pbs_directives()
+            self.hpc_subproject = directives.get("A") or self.hpc_subproject
+            if directives.get("l"):
+                self.nodes = int(directives["l"]["select"])
+                self.processes_per_node = int(directives["l"]["ncpus"])
+                self.wall_time = directives["l"]["walltime"]
+            self.queue = directives.get("q") or self.queue
+            self.notification_email = directives.get("M") or self.notification_email
+            if directives.get("m"):
+                self.notify_start = "b" in directives["m"]
+                self.notify_end = "e" in directives["m"]
+        # The batched watchers re-enable the revert button, so reset it after they have run
+        self.reset_loading()
 
     def pbs_options_view(self):
         self.pbs_options_pane = super().pbs_options_view()
@@ -0,0 +1,64 @@
+from importlib import import_module
+from unittest import mock
+from uit_plus_job.models import EnvironmentProfile
+from django.db.models import Model
+from django.test import SimpleTestCase
+
+unique_environment_profile = import_module("uit_plus_job.migrations.0002_environmentprofile_unique_environment_profile")
+
+
+class TestRenameDuplicateProfiles(SimpleTestCase):
+    def rename_duplicate_profiles(self, profiles):
+        apps = mock.Mock()
+        apps.get_model.return_value.objects.order_by.return_value = profiles
+        with mock.patch.object(Model, "save") as mock_save:
+            unique_environment_profile.rename_duplicate_profiles(apps, None)
+        apps.get_model.assert_called_once_with("uit_plus_job", "EnvironmentProfile")
+        apps.get_model.return_value.objects.order_by.assert_called_once_with("pk")
+        return mock_save
+
+    def test_rename_duplicate_profiles(self):
+        profiles = [
+            EnvironmentProfile(pk=1, user_id=1, hpc_system="topaz", software="adh", name="default"),
+            EnvironmentProfile(pk=2, user_id=1, hpc_system="topaz", software="adh", name="default"),
+            EnvironmentProfile(pk=3, user_id=1, hpc_system="onyx", software="adh", name="default"),
+            EnvironmentProfile(pk=4, user_id=2, hpc_system="topaz", software="adh", name="default"),
+            EnvironmentProfile(pk=5, user_id=1, hpc_system="topaz", software="adh", name="default"),
+        ]
+
+        mock_save = self.rename_duplicate_profiles(profiles)
+
+        # the first profile keeps its name and later duplicates get their primary key appended
+        self.assertListEqual(
+            ["default", "default (2)", "default", "default", "default (5)"], [p.name for p in profiles]
+        )
+        self.assertEqual(2, mock_save.call_count)
+        mock_save.assert_called_with(update_fields=["name"])
+
+    def test_rename_duplicate_profiles_long_name(self):
+        profiles = [
+            EnvironmentProfile(pk=1, user_id=1, hpc_system="topaz", software="adh", name="x" * 64),
+            EnvironmentProfile(pk=12, user_id=1, hpc_system="topaz", software="adh", name="x" * 64),
+        ]
+
+        self.rename_duplicate_profiles(profiles)
+
+        # the name is shortened so the suffix fits in the name column
+        self.assertEqual("x" * 59 + " (12)", profiles[1].name)
+        self.assertEqual(64, len(profiles[1].name))
+
+    def test_rename_duplicate_profiles_name_taken(self):
+        profiles = [
+            EnvironmentProfile(pk=1, user_id=1, hpc_system="topaz", software="adh", name="default"),
+            EnvironmentProfile(pk=2, user_id=1, hpc_system="topaz", software="adh", name="default"),
+            EnvironmentProfile(pk=3, user_id=1, hpc_system="topaz", software="adh", name="default (2)"),
+            EnvironmentProfile(pk=4, user_id=1, hpc_system="topaz", software="adh", name="default (2-2)"),
+        ]
+
+        mock_save = self.rename_duplicate_profiles(profiles)
+
+        # the new name skips names already in use, including those of profiles that come later
+        self.assertListEqual(
+            ["default", "default (2-3)", "default (2)", "default (2-2)"], [p.name for p in profiles]
+        )
+        mock_save.assert_called_once_with(update_fields=["name"])
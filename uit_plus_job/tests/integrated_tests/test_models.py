@@ -1,53 +1,200 @@
-import mock
-import datetime
-from uit_plus_job.models import UitPlusJob
-from uit.exceptions import DpRouteError
+import logging
+from unittest import mock
+import tempfile
+from pathlib import Path, PurePosixPath
+from uit_plus_job import models as job_models
+from uit_plus_job.models import EnvironmentProfile, UitPlusJob
+from uit.exceptions import UITError
 from django.contrib.auth.models import User
 from datetime import timedelta
-from pytz import timezone
 from django.core.exceptions import ValidationError
-from django.test import TransactionTestCase
-from social_django.models import UserSocialAuth
+from django.db import connection
+from django.db.models import Model
+from django.test import SimpleTestCase, TestCase, override_settings, skipUnlessDBFeature
+
+_BASE_JOB_KWARGS = {
+    "name": "uit_job",
+    "description": "test_description",
+    "label": "test_label",
+    "workspace": "test_ws",
+    "node_type": "compute",
+    "system": "topaz",
+    "job_id": "J0001",
+    "project_id": "P001",
+    "num_nodes": 10,
+    "processes_per_node": 5,
+    "max_time": timedelta(hours=10, seconds=42),
+    "max_cleanup_time": timedelta(hours=10, seconds=60),
+    "transfer_input_files": ("file1.xml", "file10.xml"),
+    "archive_input_files": ("file2.xml", "file3.txt"),
+    "home_input_files": ("file3.xml", "file4.xml"),
+    "transfer_output_files": ("transfer_out.out", "transfer_out2.out"),
+    "archive_output_files": ("archive_out.out", "archive_out2.out"),
+    "home_output_files": ("home.out", "test_home.out"),
+}
+
+
+def _job_kwargs(user):
+    """Build the keyword arguments for the test job, giving each job its own lists."""
+    kwargs = {key: list(value) if isinstance(value, tuple) else value for key, value in _BASE_JOB_KWARGS.items()}
+    return {**kwargs, "user": user, "_modules": {"OpenGL": "load"}}
+
+
+def setUpModule():
+    # Error paths in the model log tracebacks; the tests assert on patched loggers instead
+    logging.disable(logging.CRITICAL)
+
+
+def tearDownModule():
+    logging.disable(logging.NOTSET)
+
+
+# A fast hasher keeps creating the fixture user from dominating the class setup
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class TestUitPlusJob(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Created once per class; TestCase rolls back each test and gives it a fresh copy of these attributes
+        cls.user = User.objects.create_user("tethys1", "user@example.com", "pass")
 
+    def setUp(self):
+        # The job holds its PBS job and client, which can't be deep copied like setUpTestData attributes,
+        # so it is built per test. It saves itself when it is constructed, and the rollback removes the row.
+        self.uitplusjob = UitPlusJob(**_job_kwargs(self.user))
 
-class TestUitPlusJob(TransactionTestCase):
+    def test_remote_workspace_suffix_prop(self):
+        remote_workspace = self.uitplusjob.remote_workspace_suffix
+        self.assertIn("test_label/uit_job", remote_workspace)
 
-    def setUp(self):
-        self.tz = timezone("America/Denver")
-
-        self.user = User.objects.create_user("tethys1", "user@example.com", "pass")
-
-        self.social_auth = UserSocialAuth.create_social_auth(self.user, "username", "UITPlus")
-
-        self.uitplusjob = UitPlusJob(
-            name="uit_job",
-            user=self.user,
-            description="test_description",
-            label="test_label",
-            workspace="test_ws",
-            node_type="compute",
-            system="topaz",
-            job_id="J0001",
-            project_id="P001",
-            num_nodes=10,
-            processes_per_node=5,
-            max_time=timedelta(hours=10, seconds=42),
-            max_cleanup_time=timedelta(hours=10, seconds=60),
-            job_script="PBSScript",
-            transfer_input_files=["file1.xml", "file10.xml"],
-            archive_input_files=["file2.xml", "file3.txt"],
-            home_input_files=["file3.xml", "file4.xml"],
-            transfer_output_files=["transfer_out.out", "transfer_out2.out"],
-            archive_output_files=["archive_out.out", "archive_out2.out"],
-            home_output_files=["home.out", "test_home.out"],
-            _modules={"OpenGL": "load"},
+    def test_working_dir_prop(self):
+        self.uitplusjob._pbs_job = mock.Mock(working_dir="{WORK_DIR}/test_label/uit_job")
+
+        self.assertEqual("{WORK_DIR}/test_label/uit_job", self.uitplusjob.working_dir)
+
+    @mock.patch.object(UitPlusJob, "get_environment_variable")
+    def test_archive_dir_prop(self, mock_env_arc_dir):
+        mock_env_arc_dir.return_value = "{ARCH_DIR}"
+        archive_dir = self.uitplusjob.archive_dir
+        mock_env_arc_dir.assert_called_with("ARCHIVE_HOME")
+        self.assertIn("{ARCH_DIR}/test_label/uit_job", archive_dir)
+
+    @mock.patch.object(UitPlusJob, "client")
+    def test_home_dir_prop(self, mock_client):
+        mock_client.HOME = PurePosixPath("/home/user")
+        self.uitplusjob._home_dir = None
+
+        home_dir = self.uitplusjob.home_dir
+
+        self.assertEqual(PurePosixPath("/home/user") / self.uitplusjob.remote_workspace_suffix, home_dir)
+
+    @mock.patch.object(job_models, "AsyncClient")
+    def test_client_prop(self, mock_client):
+        mock_client_ret = mock.Mock()
+        mock_client.return_value = mock_client_ret
+        self.uitplusjob._client = None
+
+        # Execute
+        ret = self.uitplusjob.client
+
+        # the client is created once and reused
+        self.assertEqual(mock_client_ret, ret)
+        self.assertIs(ret, self.uitplusjob.client)
+        mock_client.assert_called_once_with()
+
+    @mock.patch.object(UitPlusJob, "client")
+    @mock.patch.object(Model, "save")
+    async def test_update_status_running(self, mock_save, mock_client):
+        pbs_job = mock.Mock(qstat={"status": "R"})
+        pbs_job.update_status = mock.AsyncMock(return_value="R")
+        self.uitplusjob._pbs_job = pbs_job
+
+        # call the method
+        await self.uitplusjob._update_status()
+
+        # test results
+        mock_save.assert_called()
+        self.assertEqual("RUN", self.uitplusjob._status)
+        self.assertDictEqual({"status": "R"}, self.uitplusjob.qstat)
+
+    @mock.patch.object(UitPlusJob, "client")
+    @mock.patch.object(Model, "save")
+    async def test_update_status_submitted(self, mock_save, mock_client):
+        pbs_job = mock.Mock(qstat={"status": "F"})
+        pbs_job.update_status = mock.AsyncMock(return_value="F")
+        self.uitplusjob._pbs_job = pbs_job
+        self.uitplusjob.extended_properties = {"cleanup_job_id": "C0001"}
+
+        # call the method
+        await self.uitplusjob._update_status()
+
+        # test results
+        mock_save.assert_called()
+        self.assertEqual("SUB", self.uitplusjob._status)
+        self.assertEqual("C0001", self.uitplusjob.job_id)
+
+    @mock.patch.object(UitPlusJob, "client")
+    @mock.patch.object(Model, "save")
+    async def test_update_status_unknown_job_id(self, mock_save, mock_client):
+        mock_client.system = "topaz"
+        pbs_job = mock.Mock(qstat={})
+        pbs_job.update_status = mock.AsyncMock(side_effect=UITError("qstat: Unknown Job Id J0001"))
+        self.uitplusjob._pbs_job = pbs_job
+
+        # call the method
+        await self.uitplusjob._update_status()
+
+        # a job that is no longer known to PBS is treated as finished
+        self.assertEqual("COM", self.uitplusjob._status)
+        self.assertEqual(
+            "Job ID was not found on topaz. Unable to get status information.", self.uitplusjob.status_message
         )
 
-        self.uitplusjob.save()
+    @mock.patch.object(UitPlusJob, "client")
+    async def test_update_status_uit_error(self, mock_client):
+        pbs_job = mock.Mock()
+        pbs_job.update_status = mock.AsyncMock(side_effect=UITError("DP_Route_Error"))
+        self.uitplusjob._pbs_job = pbs_job
 
-    def tearDown(self):
-        self.uitplusjob.delete()
-        self.user.delete()
+        with self.assertRaises(UITError):
+            await self.uitplusjob._update_status()
+
+
+class TestUitPlusJobNoDB(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Patch once for the class; UitPlusJob saves itself when it is constructed, so save must never run here
+        client_patcher = mock.patch.object(UitPlusJob, "client")
+        save_patcher = mock.patch.object(Model, "save")
+        cls.mock_client = client_patcher.start()
+        cls.mock_save = save_patcher.start()
+        cls.addClassCleanup(client_patcher.stop)
+        cls.addClassCleanup(save_patcher.stop)
+
+    def setUp(self):
+        self.user = User(username="tethys1", email="user@example.com")
+        self._reset_job()
+
+    def _reset_job(self):
+        """Clear the calls and results left on the class-level mocks and build a new job.
+
+        Runs before each test, and again for each subTest case of tests that loop over cases.
+        """
+        self.mock_client.reset_mock(return_value=True, side_effect=True)
+        self.mock_client.call = mock.AsyncMock()
+        self.mock_save.reset_mock()
+        self.uitplusjob = UitPlusJob(**_job_kwargs(self.user))
+
+    def _mock_pbs_job(self, **kwargs):
+        """Replace the job's PbsJob with a mock working in /work/test_label/uit_job.
+
+        Keyword arguments are passed to configure_mock, e.g. submit=mock.AsyncMock(return_value="J001").
+        """
+        pbs_job = mock.Mock(working_dir=PurePosixPath("/work/test_label/uit_job"))
+        pbs_job.resolve_path.side_effect = lambda path: pbs_job.working_dir / path
+        pbs_job.configure_mock(**kwargs)
+        self.uitplusjob._pbs_job = pbs_job
+        return pbs_job
 
     def test_init(self):
         self.assertEqual("uit_job", self.uitplusjob.name)
@@ -64,47 +211,32 @@ class TestUitPlusJob(TransactionTestCase):
         self.assertTrue(self.uitplusjob.transfer_job_script)
 
     def test_init_args(self):
-        uitplusjob_args = UitPlusJob(
-            100,  # id
-            "uit_job",  # name
-            "test_description",  # description
-            self.user.id,  # user
-            "test_label",  # label
-            datetime.datetime(2018, 1, 1),  # create_time
-            datetime.datetime(2018, 1, 1),  # execute_time
-            datetime.datetime(2018, 1, 1),  # start_time
-            datetime.datetime(2018, 1, 1),  # complete_time
-            "test_ws",  # workspace
-            {},  # extended_properties
-            "test2",  # process_results_function
-            "R",  # status
-            "test3",  # tethysjob_ptr
-            "J0001",  # job_id
-            "P001",  # project_id
-            "topaz",  # system
-            "compute",  # node_type
-            10,  # num_nodes
-            5,  # process_per_node
-            timedelta(hours=10, seconds=42),  # max_time
-            timedelta(hours=10, seconds=60),  # max_cleanup_time
-            "debug",  # queue
-            "PBSScript",  # job_script
-            True,  # transfer_job_script
-            ["file1.xml", "file10.xml"],  # transfer_input_files
-            ["file2.xml", "file3.txt"],  # archive_input_files
-            ["file3.xml", "file4.xml"],  # home_input_files
-            ["transfer_out.out", "transfer_out2.out"],  # transfer_output_files
-            ["archive_out.out", "archive_out2.out"],  # archive_output_files
-            ["home.out", "test_home.out"],  # home_output_files
-            {"OpenGL": "load"},  # _modules
-            "-j",  # _optional_directives
-            "12345",  # _remote_workspace_id
-            "workspace",
-        )  # _remote_workspace
+        # Django passes every field value positionally when it loads a job from the database
+        field_values = [getattr(self.uitplusjob, field.attname) for field in UitPlusJob._meta.concrete_fields]
+        uitplusjob_args = UitPlusJob(*field_values)
 
         self.assertEqual("uit_job", uitplusjob_args.name)
         self.assertEqual("test_description", uitplusjob_args.description)
-        self.assertEqual("PBSScript", uitplusjob_args.job_script)
+        self.assertEqual("P001", uitplusjob_args.project_id)
+        self.assertEqual(timedelta(0, 36042), uitplusjob_args.max_time)
+
+    async def test_get_token(self):
+        with mock.patch.object(User, "social_auth") as mock_social_auth:
+            mock_social_auth.get.return_value = mock.Mock(extra_data={"access_token": "foo"})
+            await self.uitplusjob.get_token()
+
+        self.assertEqual("foo", self.uitplusjob.token)
+        mock_social_auth.get.assert_called_with(provider="UITPlus")
+
+    async def test_get_token_error(self):
+        with mock.patch.object(User, "social_auth") as mock_social_auth:
+            mock_social_auth.get.return_value = mock.Mock(extra_data={})
+            await self.uitplusjob.get_token()
+
+        self.assertRaises(RuntimeError, getattr, self.uitplusjob, "token")
+
+    def test_token_not_retrieved(self):
+        self.assertRaises(RuntimeError, getattr, self.uitplusjob, "token")
 
     def test_node_type(self):
         self.uitplusjob.node_type = "compute"
@@ -136,441 +268,218 @@ class TestUitPlusJob(TransactionTestCase):
         # Field Validation
         self.assertRaises(ValidationError, self.uitplusjob.clean_fields)
 
-    def test_job_script_name_prop(self):
-        job_script_name = self.uitplusjob.job_script_name
-        self.assertEqual("PBSScript", job_script_name)
-
-    def test_job_script_name_prop_attribute_error(self):
-        self.uitplusjob.job_script = None
-        ret = self.uitplusjob.job_script_name
-        self.assertEqual("", ret)
-
-    def test_token(self):
-        mock_social = mock.MagicMock()
-        self.user.social_auth.get = mock_social
-        self.uitplusjob.user = self.user
-
-        self.social_auth.extra_data = {"access_token": "foo"}
-        self.social_auth.save()
-
-        ret_token = self.uitplusjob.token
-        self.assertEqual("foo", ret_token)
-
-    def test_token_error(self):
-        self.social_auth.extra_data = {}
-        self.social_auth.save()
-        self.assertIsNone(self.uitplusjob.token)
-
-    def test_remote_workspace_suffix_prop(self):
-        remote_workspace = self.uitplusjob.remote_workspace_suffix
-        self.assertIn("test_label/uit_job", remote_workspace)
-
-    @mock.patch("uit_plus_job.models.UitPlusJob.get_environment_variable")
-    def test_work_dir_prop(self, mock_env_work_dir):
-        mock_env_work_dir.return_value = "{WORK_DIR}"
-
-        # calling the property
-        work_dir = self.uitplusjob.work_dir
-
-        # test the results
-        mock_env_work_dir.assert_called_with("WORKDIR")
-        self.assertIn("{WORK_DIR}/test_label/uit_job/", work_dir)
-
-    @mock.patch("uit_plus_job.models.UitPlusJob.get_environment_variable")
-    def test_archive_dir_prop(self, mock_env_arc_dir):
-        mock_env_arc_dir.return_value = "{ARCH_DIR}"
-        archive_dir = self.uitplusjob.archive_dir
-        mock_env_arc_dir.assert_called_with("ARCHIVE_HOME")
-        self.assertIn("{ARCH_DIR}/test_label/uit_job", archive_dir)
-
-    @mock.patch("uit_plus_job.models.UitPlusJob.get_environment_variable")
-    def test_home_dir_prop(self, mock_env_home_dir):
-        mock_env_home_dir.return_value = "{HOME_DIR}"
-        home_dir = self.uitplusjob.home_dir
-        mock_env_home_dir.assert_called_with("HOME")
-        self.assertIn("{HOME_DIR}/test_label/uit_job", home_dir)
-
-    @mock.patch("uit_plus_job.models.Client")
-    @mock.patch("uit_plus_job.models.UitPlusJob.token")
-    def test_client_prop(self, mock_token, mock_client):
-        mock_client_ret = mock.MagicMock()
-        mock_client.return_value = mock_client_ret
-
-        # Execute
-        ret = self.uitplusjob.client
-
-        # check return value
-        self.assertEqual(mock_client_ret, ret)
-
-        # check assert call
-        mock_client.assert_called_with(token=mock_token)
-        mock_client_ret.connect.assert_called_with(system="topaz")
-
-    @mock.patch("uit_plus_job.models.UitPlusJob.client")
-    def test_get_environment_variable(self, mock_client):
-        mock_client.call.return_value = "test_return"
-
-        ret = self.uitplusjob.get_environment_variable("WORKDIR")
-
-        # test results
-        call_args = mock_client.call.call_args_list
-        self.assertEqual("echo $WORKDIR", call_args[0][1]["command"])
-        self.assertEqual("/tmp", call_args[0][1]["work_dir"])
-        self.assertEqual("test_return", ret)
-
-    # @mock.patch('uit_plus_job.models.UitPlusJob.get_environment_variable')
-    # def test_render_execution_block(self, mock_get_env):
-    #     mock_get_env.side_effect = ['{WORKDIR}', '{ARCHIVE_HOME}', '{HOME_DIR}']
-    #
-    #     ret = self.uitplusjob.render_script_templates()
-    #     self.assertIn("mkdir -p {WORKDIR}/test_label/uit_job", ret)
-    #     self.assertIn('cd {WORKDIR}/test_label/uit_job', ret)
-    #     self.assertIn('archive get -C ${ARCHIVE_HOME}/file2.xml', ret)
-    #     self.assertIn('cp ${HOME}/file3.xml .', ret)
-    #     self.assertIn('cp ${HOME}/file4.xml .', ret)
-    #     self.assertIn('chmod +x PBSScript', ret)
-    #     self.assertIn('./PBSScript', ret)
-    #     self.assertIn('cd {WORKDIR}/test_label/uit_job', ret)
-    #     self.assertIn('#PBS -l walltime=10:01:00', ret)
-    #     self.assertIn('#PBS -A P001', ret)
-    #     self.assertIn('archive mkdir -p {ARCHIVE_HOME}/test_label/uit_job/', ret)
-    #     self.assertIn('archive put -C {ARCHIVE_HOME}/test_label/uit_job/', ret)
-    #     self.assertIn('archive ls {ARCHIVE_HOME}/test_label/uit_job', ret)
-    #     self.assertIn('mkdir -p {HOME_DIR}/test_label/uit_job', ret)
-    #     self.assertIn('cp home.out {HOME_DIR}/test_label/uit_job', ret)
-    #     self.assertIn('cp home.out {HOME_DIR}/test_label/uit_job', ret)
-    #     self.assertIn('cp transfer_out.out {HOME_DIR}/test_label/uit_job', ret)
-    #     self.assertIn('rm -rf {WORKDIR}/test_label/uit_job', ret)
-
-    @mock.patch("uit_plus_job.models.UitPlusJob.get_environment_variable")
-    @mock.patch("uit_plus_job.models.UitPlusJob.client")
-    @mock.patch("django.db.models.base.Model.save")
-    def test_execute(self, mock_save, mock_client, mock_env):
-        mock_env.return_value = "{WORKDIR}"
-        mock_client.put_file.side_effect = "success"
-        mock_client.submit.return_value = "J001"
-
-        # call the method
-        self.uitplusjob._execute()
-
-        # testing the client call input arguments
-        call_args = mock_client.call.call_args_list
-        self.assertIn("mkdir -p {WORKDIR}/test_label/uit_job", call_args[0][1]["command"])
-        self.assertIn("/tmp", call_args[0][1]["work_dir"])
-
-        put_call_args = mock_client.put_file.call_args_list
-        self.assertEqual("file1.xml", put_call_args[0][1]["local_path"])
-        self.assertIn("{WORKDIR}/test_label/uit_job", put_call_args[0][1]["remote_path"])
-        self.assertEqual("file10.xml", put_call_args[1][1]["local_path"])
-        self.assertIn("{WORKDIR}/test_label/uit_job", put_call_args[1][1]["remote_path"])
-        self.assertEqual("PBSScript", put_call_args[2][1]["local_path"])
-        self.assertIn("{WORKDIR}/test_label/uit_job", put_call_args[2][1]["remote_path"])
-
-        submit_call_args = mock_client.submit.call_args_list
-        self.assertIsInstance(submit_call_args[0][0][0], UitPlusJob)
-        self.assertIn("{WORKDIR}/test_label/uit_job/", submit_call_args[0][0][1])
-
-        mock_client.put_file.assert_called()
-        self.assertEqual("J001", mock_client.submit())
-        mock_save.assert_called()
-
-    @mock.patch("uit_plus_job.models.UitPlusJob.get_environment_variable")
-    @mock.patch("uit_plus_job.models.UitPlusJob.client")
-    @mock.patch("django.db.models.base.Model.save")
-    def test_execute_client_call_runtime_error(self, mock_save, mock_client, mock_env):
-        mock_env.return_value = "{WORKDIR}"
-        mock_client.call.side_effect = RuntimeError
-        # call the method
-        self.assertRaises(RuntimeError, self.uitplusjob._execute)
-        mock_save.assert_called()
-
-    @mock.patch("uit_plus_job.models.UitPlusJob.get_environment_variable")
-    @mock.patch("uit_plus_job.models.UitPlusJob.client")
-    @mock.patch("django.db.models.base.Model.save")
-    def test_execute_transfer_input_file_runtime_error(self, mock_save, mock_client, mock_env):
-        mock_env.return_value = "{WORKDIR}"
-        mock_client.put_file.return_value = {"success": "false", "error": "test error"}
-
-        # call the method
-        self.assertRaises(RuntimeError, self.uitplusjob._execute)
-        mock_save.assert_called()
-
-        # testing the client call input arguments
-        call_args = mock_client.call.call_args_list
-        self.assertIn("mkdir -p {WORKDIR}/test_label/uit_job", call_args[0][1]["command"])
-        self.assertIn("/tmp", call_args[0][1]["work_dir"])
-
-    @mock.patch("uit_plus_job.models.UitPlusJob.get_environment_variable")
-    @mock.patch("uit_plus_job.models.UitPlusJob.client")
-    @mock.patch("django.db.models.base.Model.save")
-    def test_execute_transfer_script_runtime_error(self, mock_save, mock_client, mock_env):
-        mock_env.return_value = "{WORKDIR}"
-        mock_client.put_file.side_effect = [
-            {"success": "true"},
-            {"success": "true"},
-            {"success": "false", "error": "test error"},
-        ]
-        # call the method
-        self.assertRaises(RuntimeError, self.uitplusjob._execute)
-        mock_save.assert_called()
-
-        # testing the client call input arguments
-        call_args = mock_client.call.call_args_list
-        self.assertIn("mkdir -p {WORKDIR}/test_label/uit_job", call_args[0][1]["command"])
-        self.assertIn("/tmp", call_args[0][1]["work_dir"])
-
-    def test_parse_status(self):
-        status_string = (
-            "\n"
-            "topaz10: \n"
-            "                                                            Reqd  Reqd   Elap\n"
-            "Job ID          Username Queue    Jobname    SessID NDS TSK Memory Time  S Time\n"
-            " --------------- -------- -------- ---------- ------ --- --- ------ ----- - -----\n"
-            " 3101546.topaz10 user     transfer cleanup.pb --     1   1   --     00:05 R --\n"
-        )
-
-        ret = self.uitplusjob._parse_status(status_string)
-
-        self.assertEqual("RUN", ret)
-
-    def test_parse_status_index_error(self):
-        ret = self.uitplusjob._parse_status(None)
-
-        self.assertEqual("ERR", ret)
-
-    @mock.patch("uit_plus_job.models.UitPlusJob.client")
-    def test_get_remote_file_no_local_path(self, mock_client):
-        remote_files_names = ["file1.xml"]
-        remote_dir = "WORKDIR"
-        mock_client.get_file.return_value = {"success": True}
-        self.assertFalse(self.uitplusjob.get_remote_files(remote_dir=remote_dir, remote_filenames=remote_files_names))
-
-    @mock.patch("uit_plus_job.models.log")
-    @mock.patch("uit_plus_job.models.UitPlusJob.client")
-    def test_get_remote_file_io_error(self, mock_client, mock_log):
-        remote_files_names = ["file1.xml"]
-        remote_dir = "WORKDIR"
-        mock_client.get_file.side_effect = IOError
-
-        # call the method
-        ret = self.uitplusjob.get_remote_files(remote_dir=remote_dir, remote_filenames=remote_files_names)
-
-        # test results
-        self.assertFalse(ret)
-        self.assertEqual("Failed to get remote file: ", mock_log.error.call_args_list[0][0][0])
-
-    @mock.patch("uit_plus_job.models.os")
-    @mock.patch("uit_plus_job.models.UitPlusJob.client")
-    def test_get_remote_file(self, mock_client, mock_os):
-        remote_files_names = ["file1.xml"]
-        remote_dir = "WORKDIR"
-        mock_os.path.join.side_effect = ["local_path", "remote_path"]
-        mock_client.get_file.return_value = {"success": True}
-        mock_os.path.exists.return_value = True
-        ret = self.uitplusjob.get_remote_files(remote_dir=remote_dir, remote_filenames=remote_files_names)
-
-        # test results
-        self.assertTrue(ret)
-        call_args = mock_client.get_file.call_args
-        self.assertEqual("local_path", call_args[1]["local_path"])
-        self.assertEqual("remote_path", call_args[1]["remote_path"])
-
-    @mock.patch("uit_plus_job.models.UitPlusJob.client")
-    def test_stop(self, mock_client):
-        # call the method
-        self.assertTrue(self.uitplusjob.stop())
-
-        # test results
-        call_args = mock_client.call.call_args_list
-        self.assertDictEqual({"command": "echo $WORKDIR", "work_dir": "/tmp"}, call_args[0][1])
-        self.assertEqual("qdel J0001", call_args[1][1]["command"])
+    def test_get_environment_variable(self):
+        self.mock_client.env = {"WORKDIR": "/work"}
 
-    @mock.patch("uit_plus_job.models.UitPlusJob.client")
-    def test_stop_runtime_error(self, mock_client):
-        mock_client.call.side_effect = RuntimeError
+        self.assertEqual("/work", self.uitplusjob.get_environment_variable("WORKDIR"))
+        self.assertIsNone(self.uitplusjob.get_environment_variable("MISSING"))
 
-        # call the method
-        self.assertFalse(self.uitplusjob.stop())
-
-        # test results
-        call_args = mock_client.call.call_args_list
-        self.assertDictEqual({"command": "echo $WORKDIR", "work_dir": "/tmp"}, call_args[0][1])
+    async def test_execute(self):
+        pbs_job = self._mock_pbs_job(post_processing_job_id="J002", submit=mock.AsyncMock(return_value="J001"))
 
-    @mock.patch("uit_plus_job.models.UitPlusJob.client")
-    def test_pause(self, mock_client):
         # call the method
-        self.assertTrue(self.uitplusjob.pause())
+        await self.uitplusjob._execute(remote_name="run.pbs")
 
         # test results
-        call_args = mock_client.call.call_args_list
-        self.assertDictEqual({"command": "echo $WORKDIR", "work_dir": "/tmp"}, call_args[0][1])
-        self.assertEqual("qhold J0001", call_args[1][1]["command"])
+        pbs_job.submit.assert_awaited_once_with(remote_name="run.pbs")
+        self.assertEqual("J001", self.uitplusjob.job_id)
+        self.assertEqual("J002", self.uitplusjob.extended_properties["post_processing_job_id"])
+
+    async def test_execute_errors(self):
+        cases = (
+            (
+                "allocation",
+                UITError("insufficient allocation"),
+                None,
+                "Submission failed because subproject allocation has expired or there are insufficient hours.",
+            ),
+            ("uit_error", UITError("test error"), None, "test error"),
+            (
+                "no_script",
+                RuntimeError("test error"),
+                RuntimeError,
+                "No PBS script created. Contact web site administrator for resolution.",
+            ),
+            ("submit_error", RuntimeError("test error"), None, 'Error submitting job on "topaz": test error'),
+        )
+        for name, submit_error, call_error, message in cases:
+            with self.subTest(name=name):
+                self._reset_job()
+                self._mock_pbs_job(submit=mock.AsyncMock(side_effect=submit_error))
+                self.mock_client.call.side_effect = call_error
+
+                # call the method
+                with self.assertRaises(type(submit_error)):
+                    await self.uitplusjob._execute()
+
+                # test results
+                self.assertEqual(message, self.uitplusjob.status_message)
+                if isinstance(submit_error, UITError):
+                    self.mock_client.call.assert_not_awaited()
+                else:
+                    self.mock_client.call.assert_awaited_once_with("ls /work/test_label/uit_job/*.pbs")
+
+    @mock.patch.object(UitPlusJob, "_execute")
+    async def test_execute_submitted(self, mock_execute):
+        await self.uitplusjob.execute(remote_name="run.pbs")
+
+        mock_execute.assert_awaited_once_with(remote_name="run.pbs")
+        self.assertEqual("SUB", self.uitplusjob._status)
+        self.mock_save.assert_called()
 
-    @mock.patch("uit_plus_job.models.UitPlusJob.client")
-    def test_pause_runtime_error(self, mock_client):
-        mock_client.call.side_effect = RuntimeError
+    @mock.patch.object(UitPlusJob, "_execute")
+    async def test_execute_error(self, mock_execute):
+        mock_execute.side_effect = RuntimeError
 
-        # call the method
-        self.assertFalse(self.uitplusjob.pause())
+        await self.uitplusjob.execute()
 
-        # test results
-        call_args = mock_client.call.call_args_list
-        self.assertDictEqual({"command": "echo $WORKDIR", "work_dir": "/tmp"}, call_args[0][1])
+        self.assertEqual("ERR", self.uitplusjob._status)
+        self.mock_save.assert_called()
 
-    @mock.patch("uit_plus_job.models.UitPlusJob.client")
-    def test_resume(self, mock_client):
-        # call the method
-        self.assertTrue(self.uitplusjob.resume())
+    def test_get_remote_file_no_local_path(self):
+        with tempfile.TemporaryDirectory() as workspace:
+            self.uitplusjob.workspace = workspace
+            self._mock_pbs_job()
 
-        # test results
-        call_args = mock_client.call.call_args_list
+            self.assertFalse(self.uitplusjob.get_remote_files(["file1.xml"]))
 
-        self.assertDictEqual({"command": "echo $WORKDIR", "work_dir": "/tmp"}, call_args[0][1])
-        self.assertEqual("qrls J0001", call_args[1][1]["command"])
+    @mock.patch.object(job_models, "log")
+    def test_get_remote_file_runtime_error(self, mock_log):
+        self.mock_client.get_file.side_effect = RuntimeError("test error")
 
-    @mock.patch("uit_plus_job.models.UitPlusJob.client")
-    def test_resume_runtime_error(self, mock_client):
-        mock_client.call.side_effect = RuntimeError
+        with tempfile.TemporaryDirectory() as workspace:
+            self.uitplusjob.workspace = workspace
+            self._mock_pbs_job()
 
-        # call the method
-        self.assertFalse(self.uitplusjob.resume())
+            # call the method
+            ret = self.uitplusjob.get_remote_files(["file1.xml"])
 
         # test results
-        call_args = mock_client.call.call_args_list
-
-        self.assertDictEqual({"work_dir": "/tmp", "command": "echo $WORKDIR"}, call_args[0][1])
-
-    @mock.patch("uit_plus_job.models.UitPlusJob.render_clean_script")
-    @mock.patch("uit_plus_job.models.UitPlusJob.client")
-    def test_clean(self, mock_client, mock_pbs):
-        mock_pbs.return_value = "test_pbs_render_out"
-        self.assertTrue(self.uitplusjob.clean(archive=True))
-        client_submit_args = mock_client.submit.call_args_list
-        self.assertEqual("test_pbs_render_out", client_submit_args[0][0][0])
-        self.assertDictEqual({"remote_name": "clean.pbs"}, client_submit_args[0][1])
-
-    @mock.patch("uit_plus_job.models.UitPlusJob.render_clean_script")
-    @mock.patch("uit_plus_job.models.UitPlusJob.client")
-    def test_clean_runtime_error(self, mock_client, mock_pbs):
-        mock_client.submit.side_effect = RuntimeError
-        mock_pbs.return_value = "test_pbs_render_out"
-        self.assertFalse(self.uitplusjob.clean(archive=True))
-        client_submit_args = mock_client.submit.call_args_list
-        self.assertEqual("test_pbs_render_out", client_submit_args[0][0][0])
-        self.assertDictEqual({"remote_name": "clean.pbs"}, client_submit_args[0][1])
-
-    @mock.patch("uit_plus_job.models.UitPlusJob.get_environment_variable")
-    def test_render_clean_script(self, mock_get_env):
-        mock_get_env.side_effect = ["{WORKDIR}", "{ARCHIVE_HOME}", "{HOME_DIR}"]
-
-        # call the method
-        res = self.uitplusjob.render_clean_script()
-
-        # test the results
-        self.assertIn("#PBS -l walltime=10:01:00", res)
-        self.assertIn("#PBS -A P001", res)
-        self.assertIn("rm -rf {WORKDIR}/test_label/uit_job/", res)
-        self.assertIn("rm -rf {HOME_DIR}/test_label/uit_job/", res)
+        self.assertFalse(ret)
+        self.assertEqual("Failed to get remote file: test error", mock_log.error.call_args.args[0])
+
+    def test_get_remote_file(self):
+        with tempfile.TemporaryDirectory() as workspace:
+            self.uitplusjob.workspace = workspace
+            self._mock_pbs_job()
+
+            # os.path is shared by the whole process, so only patch exists around the call under test
+            with mock.patch.object(job_models.os.path, "exists", return_value=True) as mock_exists:
+                ret = self.uitplusjob.get_remote_files(["out/file1.xml"])
+
+            # test results
+            self.assertTrue(ret)
+            mock_exists.assert_called_once_with(Path(workspace) / "out/file1.xml")
+            self.assertTrue((Path(workspace) / "out").is_dir())
+            get_file_kwargs = self.mock_client.get_file.call_args.kwargs
+            self.assertEqual(PurePosixPath("/work/test_label/uit_job/out/file1.xml"), get_file_kwargs["remote_path"])
+            self.assertEqual(Path(workspace) / "out/file1.xml", get_file_kwargs["local_path"])
+
+    async def test_stop(self):
+        for result, status in ((True, "ABT"), (False, "ERR")):
+            with self.subTest(result=result):
+                self._reset_job()
+                pbs_job = self._mock_pbs_job(terminate=mock.AsyncMock(return_value=result))
+
+                # call the method
+                self.assertEqual(result, await self.uitplusjob.stop())
+
+                # test results
+                pbs_job.terminate.assert_awaited_once_with()
+                self.assertEqual(status, self.uitplusjob._status)
+
+    async def test_pause_resume(self):
+        for method, pbs_method in (("pause", "hold"), ("resume", "release")):
+            for result in (True, False):
+                with self.subTest(method=method, result=result):
+                    self._reset_job()
+                    pbs_job = self._mock_pbs_job(**{pbs_method: mock.AsyncMock(return_value=result)})
+
+                    # call the method
+                    self.assertEqual(result, await getattr(self.uitplusjob, method)())
+
+                    # test results
+                    getattr(pbs_job, pbs_method).assert_awaited_once_with()
+
+    async def test_clean(self):
+        with tempfile.TemporaryDirectory() as workspace:
+            self.uitplusjob.workspace = workspace
+            self._mock_pbs_job()
+            self.uitplusjob._home_dir = PurePosixPath("/home/test_label/uit_job")
+
+            # call the method
+            self.assertTrue(await self.uitplusjob.clean())
+
+            # test results
+            self.assertFalse(Path(workspace).exists())
+        self.mock_client.call.assert_has_awaits(
+            [
+                mock.call(command="rm -rf /work/test_label/uit_job || true", working_dir="/"),
+                mock.call(command="rm -rf /home/test_label/uit_job || true", working_dir="/"),
+            ],
+            any_order=True,
+        )
 
-    @mock.patch("uit_plus_job.models.UitPlusJob.get_remote_files")
-    @mock.patch("uit_plus_job.models.UitPlusJob.get_environment_variable")
-    def test_process_results(self, mock_get_env, mock_remote_files):
-        mock_get_env.side_effect = ["{WORKDIR}", "{HOME_DIR}"]
+    async def test_clean_archive(self):
+        self.uitplusjob.workspace = ""
+        self.uitplusjob._archive_dir = "/archive/test_label/uit_job"
 
         # call the method
-        self.uitplusjob._process_results()
+        self.assertTrue(await self.uitplusjob.clean(archive=True))
 
         # test results
-        call_args = mock_remote_files.call_args_list
-        self.assertListEqual(["transfer_out.out", "transfer_out2.out"], call_args[0][0][1])
-        self.assertListEqual(["log.stdout", "log.stderr"], call_args[1][0][1])
-
-    @mock.patch("uit_plus_job.models.UitPlusJob.client")
-    def test_update_status_no_cleanup_job_id(self, mock_client):
-        mock_client.call.return_value = (
-            "\n"
-            "topaz10: \n"
-            "                                                            Reqd  Reqd   Elap\n"
-            "Job ID          Username Queue    Jobname    SessID NDS TSK Memory Time  S Time\n"
-            " --------------- -------- -------- ---------- ------ --- --- ------ ----- - -----\n"
-            " 3101546.topaz10 user     transfer cleanup.pb --     1   1   --     00:05 F --\n"
+        self.mock_client.call.assert_awaited_once_with(
+            command="archive rm -rf /archive/test_label/uit_job || true", working_dir="/"
         )
 
-        # test the method
-        self.assertRaises(RuntimeError, self.uitplusjob._update_status)
-
-    @mock.patch("uit_plus_job.models.UitPlusJob.client")
-    @mock.patch("django.db.models.base.Model.save")
-    def test_update_status_running(self, mock_save, mock_client):
-        mock_client.call.return_value = (
-            "\n"
-            "topaz10: \n"
-            "                                                            Reqd  Reqd   Elap\n"
-            "Job ID          Username Queue    Jobname    SessID NDS TSK Memory Time  S Time\n"
-            " --------------- -------- -------- ---------- ------ --- --- ------ ----- - -----\n"
-            " 3101546.topaz10 user     transfer cleanup.pb --     1   1   --     00:05 R --\n"
-        )
+    async def test_clean_local(self):
+        self.uitplusjob.workspace = ""
 
         # call the method
-        self.uitplusjob._update_status()
+        self.assertTrue(await self.uitplusjob.clean(remote=False))
 
         # test results
-        mock_save.assert_called()
-        self.assertEqual("RUN", self.uitplusjob._status)
-
-    @mock.patch("uit_plus_job.models.log")
-    @mock.patch("uit_plus_job.models.UitPlusJob.client")
-    def test_update_status_runtime_error(self, mock_client, mock_logging):
-        mock_client.call.side_effect = RuntimeError
+        self.mock_client.call.assert_not_awaited()
 
+    @mock.patch.object(UitPlusJob, "get_remote_files")
+    def test_process_results(self, mock_remote_files):
         # call the method
-        self.assertIsNone(self.uitplusjob._update_status())
+        self.uitplusjob._process_results()
 
         # test results
-        call_args = mock_client.call.call_args_list
-        self.assertDictEqual({"work_dir": "/tmp", "command": "qstat -H J0001"}, call_args[0][1])
-
-        self.assertEqual(
-            "Attempt to get status for job %s failed: %s",
-            mock_logging.error.call_args_list[0][0][0],
+        mock_remote_files.assert_called_once()
+        self.assertListEqual(["transfer_out.out", "transfer_out2.out"], mock_remote_files.call_args.args[0])
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class TestEnvironmentProfile(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("tethys1", "user@example.com", "pass")
+        profile_kwargs = dict(user=cls.user, hpc_system="topaz", software="adh")
+        cls.general = EnvironmentProfile.objects.create(name="general", user_default=True, **profile_kwargs)
+        cls.v1 = EnvironmentProfile.objects.create(name="v1", default_for_versions=["1.0", "1.1"], **profile_kwargs)
+        cls.other_system = EnvironmentProfile.objects.create(
+            name="other", user=cls.user, hpc_system="onyx", software="adh", default_for_versions=["2.0"]
         )
-        self.assertEqual("J0001", mock_logging.error.call_args_list[0][0][1])
-
-    @mock.patch("uit_plus_job.models.log")
-    @mock.patch("uit_plus_job.models.UitPlusJob.client")
-    def test_update_status_dproute_error(self, mock_client, mock_logging):
-        mock_client.call.side_effect = DpRouteError("DP_Route_Error")
 
-        # call the method
-        self.assertIsNone(self.uitplusjob._update_status())
-
-        # test results
-        call_args = mock_client.call.call_args_list
-        self.assertDictEqual({"command": "qstat -H J0001", "work_dir": "/tmp"}, call_args[0][1])
-
-        self.assertEqual("qstat -H J0001", call_args[0][1]["command"])
-        self.assertEqual("/tmp", call_args[0][1]["work_dir"])
-
-        self.assertEqual("Ignoring DP_Route error: DP_Route_Error", mock_logging.info.call_args[0][0])
-
-    @mock.patch("uit_plus_job.models.UitPlusJob.client")
-    @mock.patch("django.db.models.base.Model.save")
-    def test_update_status_submitted(self, mock_save, mock_client):
-        mock_client.call.return_value = (
-            "\n"
-            "topaz10: \n"
-            "                                                            Reqd  Reqd   Elap\n"
-            "Job ID          Username Queue    Jobname    SessID NDS TSK Memory Time  S Time\n"
-            "--------------- -------- -------- ---------- ------ --- --- ------ ----- - -----\n"
-            "3101546.topaz10 user     transfer cleanup.pb --     1   1   --     00:05 F --\n"
+    def assertDefaultsForVersion(self):
+        get_default = EnvironmentProfile._get_default_for_version
+        self.assertEqual(self.v1, get_default(self.user, "topaz", "adh", "1.1"))
+        self.assertIsNone(get_default(self.user, "topaz", "adh", "2.0"))
+        self.assertIsNone(get_default(self.user, "topaz", "adh", "1"))
+
+    @skipUnlessDBFeature("supports_json_field_contains")
+    def test_get_default_for_version_json_contains(self):
+        self.assertDefaultsForVersion()
+
+    def test_get_default_for_version_without_json_contains(self):
+        with mock.patch.object(connection.features, "supports_json_field_contains", False):
+            self.assertDefaultsForVersion()
+
+    def test_get_default(self):
+        self.assertEqual(self.v1, EnvironmentProfile.get_default(self.user, "topaz", "adh", version="1.0"))
+        self.assertEqual(self.general, EnvironmentProfile.get_default(self.user, "topaz", "adh", version="2.0"))
+        self.assertIsNone(
+            EnvironmentProfile.get_default(self.user, "topaz", "adh", version="2.0", use_general_default=False)
         )
-
-        self.uitplusjob.extended_properties = {"cleanup_job_id": "C0001"}
-
-        # call the method
-        self.uitplusjob._update_status()
-
-        # test results
-        mock_save.assert_called()
-        self.assertEqual("SUB", self.uitplusjob._status)
-        self.assertEqual("C0001", self.uitplusjob.job_id)
@@ -0,0 +1,165 @@
+from types import SimpleNamespace
+from unittest import mock
+from channels.db import database_sync_to_async
+from uit_plus_job.models import EnvironmentProfile
+from uit_plus_job.submit_stage import TethysProfileManagement
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+
+PBS_SCRIPT = """#!/bin/bash
+#PBS -l select=2:ncpus=44:mpiprocs=44
+
+module load gcc/9.1
+export VERSION=1.2
+"""
+
+create_profile = database_sync_to_async(EnvironmentProfile.objects.create)
+
+
+class ProfileLookups:
+    """The profile lookups of TethysProfileManagement, without the panel widgets around them."""
+
+    version_environment_variable = "VERSION"
+
+    get_profiles = TethysProfileManagement.get_profiles
+    _filter_cached_profiles = TethysProfileManagement._filter_cached_profiles
+    _cached_profiles_by_name = TethysProfileManagement._cached_profiles_by_name
+    get_profile = TethysProfileManagement.get_profile
+    get_default_profile = TethysProfileManagement.get_default_profile
+    _get_default_profile = TethysProfileManagement._get_default_profile
+    _invalidate_profile_caches = TethysProfileManagement._invalidate_profile_caches
+
+    def __init__(self, user, system):
+        self.tethys_user = user
+        self.uit_client = SimpleNamespace(system=system)
+        self.software = "adh"
+        self._default_profile_cache = {}
+        self._profiles_cache = {}
+        self._profile_by_name = {}
+
+
+class SolverVersionLookups(ProfileLookups):
+    version_environment_variable = "SOLVER_VERSION"
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class TestTethysProfileManagement(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("tethys1", "user@example.com", "pass")
+        profile_kwargs = dict(user=cls.user, software="adh")
+        EnvironmentProfile.objects.create(
+            name="a", hpc_system="topaz", version="1.0", user_default=True, **profile_kwargs
+        )
+        # Profiles saved before the version column existed only have the version in their environment variables
+        EnvironmentProfile.objects.create(
+            name="b", hpc_system="topaz", environment_variables='{"VERSION": "1.0"}', **profile_kwargs
+        )
+        EnvironmentProfile.objects.create(
+            name="c", hpc_system="topaz", version="2.0", default_for_versions=["2.0"], **profile_kwargs
+        )
+        EnvironmentProfile.objects.create(
+            name="d", hpc_system="onyx", version="1.0", user_default=True, **profile_kwargs
+        )
+        EnvironmentProfile.objects.create(
+            name="e", hpc_system="topaz", environment_variables='{"SOLVER_VERSION": "2.0"}', **profile_kwargs
+        )
+
+    def setUp(self):
+        self.lookups = ProfileLookups(self.user, "topaz")
+
+    async def test_get_profiles(self):
+        self.assertListEqual(["a", "b", "c", "e"], await self.lookups.get_profiles())
+        self.assertListEqual(["a", "b"], await self.lookups.get_profiles(version="1.0"))
+        self.assertListEqual(["c"], await self.lookups.get_profiles(version="2.0"))
+        self.assertListEqual([], await self.lookups.get_profiles(version="3.0"))
+
+    async def test_get_profiles_version_environment_variable(self):
+        # legacy profiles are matched by the variable the subclass keeps the version in
+        lookups = SolverVersionLookups(self.user, "topaz")
+
+        self.assertListEqual(["c", "e"], await lookups.get_profiles(version="2.0"))
+        self.assertListEqual(["a"], await lookups.get_profiles(version="1.0"))
+
+    async def test_get_profiles_include_meta(self):
+        self.assertListEqual(["a", "b", "c", "e"], await self.lookups.get_profiles(include_meta=True))
+
+        # the version filter on the cached profiles matches the query, including legacy profiles
+        self.assertListEqual(["a", "b", "c", "e"], self.lookups._filter_cached_profiles())
+        self.assertListEqual(["a", "b"], self.lookups._filter_cached_profiles(version="1.0"))
+        self.assertListEqual(["c"], self.lookups._filter_cached_profiles(version="2.0"))
+
+        lookups = SolverVersionLookups(self.user, "topaz")
+        await lookups.get_profiles(include_meta=True)
+        self.assertListEqual(["c", "e"], lookups._filter_cached_profiles(version="2.0"))
+
+    async def test_get_profiles_cached_per_system(self):
+        await self.lookups.get_profiles(version="1.0")
+        await create_profile(user=self.user, name="f", hpc_system="topaz", software="adh", version="1.0")
+
+        # the names are reused until the caches are cleared
+        self.assertListEqual(["a", "b"], await self.lookups.get_profiles(version="1.0"))
+        self.lookups.uit_client.system = "onyx"
+        self.assertListEqual(["d"], await self.lookups.get_profiles(version="1.0"))
+
+        self.lookups.uit_client.system = "topaz"
+        self.lookups._invalidate_profile_caches()
+        self.assertListEqual(["a", "b", "f"], await self.lookups.get_profiles(version="1.0"))
+
+    async def test_get_profile_cached_per_system(self):
+        await self.lookups.get_profiles(include_meta=True)
+        profile = await self.lookups.get_profile(name="a")
+
+        # the cached instance is returned for the system it was loaded for only
+        self.assertIs(profile, await self.lookups.get_profile(name="a"))
+        self.lookups.uit_client.system = "onyx"
+        self.assertEqual("d", (await self.lookups.get_profile(name="d")).name)
+        with self.assertRaises(EnvironmentProfile.DoesNotExist):
+            await self.lookups.get_profile(name="a")
+
+    async def test_get_default_profile_cached_per_system(self):
+        self.assertEqual("c", (await self.lookups.get_default_profile(version="2.0")).name)
+        self.assertEqual("a", (await self.lookups.get_default_profile(version="1.0", use_general_default=True)).name)
+        self.assertIsNone(await self.lookups.get_default_profile(version="1.0"))
+
+        cached = await self.lookups.get_default_profile(version="2.0")
+        self.assertIs(cached, await self.lookups.get_default_profile(version="2.0"))
+
+        self.lookups.uit_client.system = "onyx"
+        self.assertIsNone(await self.lookups.get_default_profile(version="2.0"))
+        self.assertEqual("d", (await self.lookups.get_default_profile(version="2.0", use_general_default=True)).name)
+
+
+class TestTethysProfileManagementNoDB(SimpleTestCase):
+    def test_scan_pbs_body_returns_copies(self):
+        obj = SimpleNamespace(pbs_body=PBS_SCRIPT, _pbs_scan_cache=None)
+        parsed_body, directives = TethysProfileManagement._scan_pbs_body(obj)
+        parsed_body["modules_to_load"].append("changed")
+        parsed_body["environment_variables"]["VERSION"] = "changed"
+        directives["l"]["select"] = "changed"
+
+        parsed_body, directives = TethysProfileManagement._scan_pbs_body(obj)
+
+        self.assertListEqual(["gcc/9.1"], parsed_body["modules_to_load"])
+        self.assertEqual("1.2", parsed_body["environment_variables"]["VERSION"])
+        self.assertEqual("2", directives["l"]["select"])
+
+    def test_schedule_select_profile_already_loaded(self):
+        obj = mock.Mock(environment_profile="a", _currently_loaded_profile="a")
+
+        TethysProfileManagement.schedule_select_profile(obj)
+
+        # nothing is loaded, but the loading state the browser set on the panel is cleared
+        obj._cancel_select_profile.assert_called_once_with()
+        obj._reset_profile_panel_loading.assert_called_once_with()
+        obj.reset_loading.assert_not_called()
+
+    def test_cancel_select_profile(self):
+        select_profile_cb = mock.Mock()
+        obj = SimpleNamespace(_select_profile_cb=select_profile_cb)
+
+        TethysProfileManagement._cancel_select_profile(obj)
+        TethysProfileManagement._cancel_select_profile(obj)
+
+        select_profile_cb.stop.assert_called_once_with()
+        self.assertIsNone(obj._select_profile_cb)
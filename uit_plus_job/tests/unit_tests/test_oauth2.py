@@ -14,11 +14,11 @@ from uit_plus_job.oauth2 import UitPlusOAuth2
 
 class UitPlusOAuth2Tests(unittest.TestCase):
 
-    def setUp(self):
-        self.auth = UitPlusOAuth2(strategy=mock.MagicMock())
-
-    def tearDown(self):
-        pass
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # The backend is shared by all tests, so patch its methods per test rather than assigning to them
+        cls.auth = UitPlusOAuth2(strategy=mock.MagicMock())
 
     def test_attributes(self):
         self.assertEqual("UITPlus", self.auth.name)
@@ -31,12 +31,16 @@ class UitPlusOAuth2Tests(unittest.TestCase):
         self.assertEqual("POST", self.auth.REFRESH_TOKEN_METHOD)
         self.assertIn("UIT", self.auth.DEFAULT_SCOPE)
         self.assertEqual("USERNAME", self.auth.ID_KEY)
-        self.assertIn(("USERNAME", "email"), self.auth.EXTRA_DATA)
-        self.assertIn(("USERNAME", "id"), self.auth.EXTRA_DATA)
-        self.assertIn(("SYSTEMS", "systems"), self.auth.EXTRA_DATA)
-        self.assertIn(("access_token_expires_on", "expires_in"), self.auth.EXTRA_DATA)
-        self.assertIn(("refresh_token", "refresh_token"), self.auth.EXTRA_DATA)
-        self.assertIn(("refresh_token_expires_on", "refresh_expires_in"), self.auth.EXTRA_DATA)
+        expected_extra_data = {
+            ("USERNAME", "email"),
+            ("USERNAME", "id"),
+            ("SYSTEMS", "systems"),
+            ("access_token_expires_on", "expires_in"),
+            ("refresh_token", "refresh_token"),
+            ("refresh_token_expires_on", "refresh_expires_in"),
+        }
+        # an empty difference means every expected entry is present; otherwise it lists the missing ones
+        self.assertEqual(set(), expected_extra_data - set(self.auth.EXTRA_DATA))
 
     def test_get_user_details_with_hpc_username(self):
         hpc_username = "foo@bar.com"
@@ -56,12 +60,11 @@ class UitPlusOAuth2Tests(unittest.TestCase):
         userinfo = {"USERNAME": "fake@mail.com"}
         mock_token = "123abc-456def-1a2b3c4d5e6f-ab12"
         mock_response = {"foo": "bar"}
-        self.auth.get_json = mock.MagicMock()
-        self.auth.get_json.return_value = {"userinfo": userinfo}
-
-        ret = self.auth.user_data(mock_token, response=mock_response)
+        with mock.patch.object(self.auth, "get_json") as mock_get_json:
+            mock_get_json.return_value = {"userinfo": userinfo}
+            ret = self.auth.user_data(mock_token, response=mock_response)
 
-        self.auth.get_json.assert_called_with(self.auth.USER_DATA_URL, headers={"x-uit-auth-token": mock_token})
+        mock_get_json.assert_called_with(self.auth.USER_DATA_URL, headers={"x-uit-auth-token": mock_token})
         self.assertEqual(2, len(ret))
         self.assertIn("USERNAME", ret)
         self.assertEqual("fake@mail.com", ret["USERNAME"])
@@ -71,12 +74,11 @@ class UitPlusOAuth2Tests(unittest.TestCase):
     def test_user_data_no_response(self):
         userinfo = {"USERNAME": "fake@mail.com"}
         mock_token = "123abc-456def-1a2b3c4d5e6f-ab12"
-        self.auth.get_json = mock.MagicMock()
-        self.auth.get_json.return_value = {"userinfo": userinfo}
-
-        ret = self.auth.user_data(mock_token)
+        with mock.patch.object(self.auth, "get_json") as mock_get_json:
+            mock_get_json.return_value = {"userinfo": userinfo}
+            ret = self.auth.user_data(mock_token)
 
-        self.auth.get_json.assert_called_with(self.auth.USER_DATA_URL, headers={"x-uit-auth-token": mock_token})
+        mock_get_json.assert_called_with(self.auth.USER_DATA_URL, headers={"x-uit-auth-token": mock_token})
         self.assertEqual(1, len(ret))
         self.assertIn("USERNAME", ret)
         self.assertEqual("fake@mail.com", ret["USERNAME"])
@@ -84,12 +86,11 @@ class UitPlusOAuth2Tests(unittest.TestCase):
     def test_user_data_no_userinfo(self):
         mock_token = "123abc-456def-1a2b3c4d5e6f-ab12"
         mock_response = {"foo": "bar"}
-        self.auth.get_json = mock.MagicMock()
-        self.auth.get_json.return_value = {"goo": "jar"}
+        with mock.patch.object(self.auth, "get_json") as mock_get_json:
+            mock_get_json.return_value = {"goo": "jar"}
+            ret = self.auth.user_data(mock_token, response=mock_response)
 
-        ret = self.auth.user_data(mock_token, response=mock_response)
-
-        self.auth.get_json.assert_called_with(self.auth.USER_DATA_URL, headers={"x-uit-auth-token": mock_token})
+        mock_get_json.assert_called_with(self.auth.USER_DATA_URL, headers={"x-uit-auth-token": mock_token})
         self.assertEqual(1, len(ret))
         self.assertIn("foo", ret)
         self.assertEqual("bar", ret["foo"])
@@ -98,10 +99,9 @@ class UitPlusOAuth2Tests(unittest.TestCase):
     def test_user_data_exception(self):
         mock_token = "123abc-456def-1a2b3c4d5e6f-ab12"
         mock_response = {"foo": "bar"}
-        self.auth.get_json = mock.MagicMock()
-        self.auth.get_json.side_effect = Exception
-
-        ret = self.auth.user_data(mock_token, response=mock_response)
+        with mock.patch.object(self.auth, "get_json") as mock_get_json:
+            mock_get_json.side_effect = Exception
+            ret = self.auth.user_data(mock_token, response=mock_response)
 
-        self.auth.get_json.assert_called_with(self.auth.USER_DATA_URL, headers={"x-uit-auth-token": mock_token})
+        mock_get_json.assert_called_with(self.auth.USER_DATA_URL, headers={"x-uit-auth-token": mock_token})
         self.assertEqual(mock_response, ret)
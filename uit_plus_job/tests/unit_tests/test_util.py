@@ -0,0 +1,104 @@
+import unittest
+from datetime import timedelta
+from uit_plus_job.util import scan_pbs_script, strfdelta
+
+
+PBS_SCRIPT = """#!/bin/bash
+#PBS -A ABC123
+#PBS -q debug
+#PBS -M user@example.com
+#PBS -m be
+#PBS -l select=2:ncpus=44:mpiprocs=44
+#PBS -l place=scatter
+#PBS -l walltime=01:30:00
+
+module load gcc/9.1 openmpi
+module unload intel
+module swap python/2.7 python/3.9
+export VERSION=1.2
+export OPTS=--flag=value
+setenv SOLVER fast
+"""
+
+
+class StrfdeltaTests(unittest.TestCase):
+
+    def test_format(self):
+        self.assertEqual("01:02:03", strfdelta(timedelta(hours=1, minutes=2, seconds=3), "%H:%M:%S"))
+        self.assertEqual("01h 02m", strfdelta(timedelta(hours=1, minutes=2, seconds=3), "%{H}h %{M}m"))
+        self.assertEqual("100%:00", strfdelta(timedelta(hours=100), "%{H}%%:%M"))
+
+    def test_days_count_as_hours(self):
+        self.assertEqual("49:00:01", strfdelta(timedelta(days=2, hours=1, seconds=1), "%H:%M:%S"))
+
+    def test_microseconds_carry(self):
+        # Rounding the microseconds can carry into the minutes and hours, even when seconds are not shown
+        tdelta = timedelta(hours=1, minutes=59, seconds=59, microseconds=600000)
+
+        self.assertEqual("02:00:00", strfdelta(tdelta, "%H:%M:%S"))
+        self.assertEqual("02:00", strfdelta(tdelta, "%H:%M"))
+        self.assertEqual("01:59", strfdelta(tdelta - timedelta(microseconds=200000), "%H:%M"))
+
+    def test_microseconds_round_half_to_even(self):
+        self.assertEqual("00:00:02", strfdelta(timedelta(seconds=2, microseconds=500000), "%H:%M:%S"))
+        self.assertEqual("00:00:04", strfdelta(timedelta(seconds=3, microseconds=500000), "%H:%M:%S"))
+        self.assertEqual("00:00:03", strfdelta(timedelta(seconds=2, microseconds=500001), "%H:%M:%S"))
+        self.assertEqual("00:00:02", strfdelta(timedelta(seconds=2, microseconds=499999), "%H:%M:%S"))
+
+    def test_fast_path_matches_template(self):
+        for seconds in (0, 1, 59, 60, 3599, 3600, 86399, 86400, 359999, 360000):
+            for microseconds in (0, 499999, 500000, 500001):
+                tdelta = timedelta(seconds=seconds, microseconds=microseconds)
+                with self.subTest(tdelta=tdelta):
+                    self.assertEqual(strfdelta(tdelta, "%{H}:%{M}:%{S}"), strfdelta(tdelta, "%H:%M:%S"))
+
+    def test_invalid_placeholder(self):
+        self.assertRaises(KeyError, strfdelta, timedelta(seconds=1), "%D")
+        self.assertRaises(ValueError, strfdelta, timedelta(seconds=1), "%")
+
+
+class ScanPbsScriptTests(unittest.TestCase):
+
+    def scan(self, pbs_body):
+        return scan_pbs_script(pbs_body)
+
+    def test_directives(self):
+        directives = self.scan(PBS_SCRIPT)[1]
+
+        self.assertEqual("ABC123", directives["A"])
+        self.assertEqual("debug", directives["q"])
+        self.assertEqual("user@example.com", directives["M"])
+        self.assertEqual("be", directives["m"])
+
+    def test_l_directives(self):
+        # Every -l line contributes its own resources
+        l_directives = self.scan(PBS_SCRIPT)[1]["l"]
+
+        self.assertDictEqual(
+            {"select": "2", "ncpus": "44", "mpiprocs": "44", "place": "scatter", "walltime": "01:30:00"},
+            l_directives,
+        )
+
+    def test_no_l_directives(self):
+        directives = self.scan("#PBS -q debug\n")[1]
+
+        self.assertDictEqual({}, directives["l"])
+
+    def test_modules(self):
+        parsed_body = self.scan(PBS_SCRIPT)[0]
+
+        self.assertListEqual(["gcc/9.1", "openmpi", "python/3.9"], parsed_body["modules_to_load"])
+        self.assertListEqual(["intel", "python/2.7"], parsed_body["modules_to_unload"])
+
+    def test_environment_variables(self):
+        parsed_body = self.scan(PBS_SCRIPT)[0]
+
+        self.assertDictEqual(
+            {"VERSION": "1.2", "OPTS": "--flag=value", "SOLVER": "fast"},
+            parsed_body["environment_variables"],
+        )
+
+    def test_setenv_without_value(self):
+        parsed_body = self.scan("setenv SOLVER\nsetenv VERSION 1.2\n")[0]
+
+        self.assertDictEqual({"VERSION": "1.2"}, parsed_body["environment_variables"])
@@ -7,6 +7,8 @@
 ********************************************************************************
 """
 
+import re
+from functools import lru_cache
 from string import Template
 
 
@@ -14,6 +16,49 @@ class DeltaTemplate(Template):
     delimiter = "%"
 
 
+_DELTA_FIELDS = ("H", "M", "S")
+
+_TWO_DIGIT = tuple("%02d" % i for i in range(100))
+
+
+def _two_digit(value):
+    """
+    Zero-pads the given integer to two digits, using the lookup table when it applies.
+    """
+    return _TWO_DIGIT[value] if 0 <= value < 100 else "{:02}".format(value)
+
+
+@lru_cache(maxsize=32)
+def _compile_fmt(fmt):
+    """
+    Translates a DeltaTemplate format into an equivalent str.format template.
+
+    The fields are positional, in the order of _DELTA_FIELDS (hours, minutes, seconds).
+
+    Args:
+        fmt(str): format using the DeltaTemplate placeholders (e.g. "%H:%M:%S").
+
+    Returns:
+        callable: the bound format method of the translated template.
+    """
+    template = []
+    end = 0
+    for mo in DeltaTemplate.pattern.finditer(fmt):
+        template.append(fmt[end : mo.start()].replace("{", "{{").replace("}", "}}"))
+        end = mo.end()
+        name = mo.group("named") or mo.group("braced")
+        if name is not None:
+            if name not in _DELTA_FIELDS:
+                raise KeyError(name)
+            template.append("{%d}" % _DELTA_FIELDS.index(name))
+        elif mo.group("escaped") is not None:
+            template.append("%")
+        else:
+            raise ValueError(f"Invalid placeholder in format: {fmt!r}")
+    template.append(fmt[end:].replace("{", "{{").replace("}", "}}"))
+    return "".join(template).format
+
+
 def strfdelta(tdelta, fmt):
     """
     Converts the given duration of delta time into H:M:S format.
@@ -25,11 +70,89 @@ def strfdelta(tdelta, fmt):
     Returns:
         str: formatted delta time duration value.
     """
-    d = {}
-    hours, rem = divmod(tdelta.total_seconds(), 3600)
+    # Work in whole seconds, rounding the microseconds half to even like round() did
+    total = tdelta.days * 86400 + tdelta.seconds
+    if tdelta.microseconds > 500000 or (tdelta.microseconds == 500000 and total % 2):
+        total += 1
+    hours, rem = divmod(total, 3600)
     minutes, seconds = divmod(rem, 60)
-    d["H"] = "{:02}".format(int(hours))
-    d["M"] = "{:02}".format(int(minutes))
-    d["S"] = "{:02}".format(round(seconds))
-    t = DeltaTemplate(fmt)
-    return t.substitute(**d)
+    if fmt == "%H:%M:%S":
+        # Common case, skips the format lookup
+        return f"{_two_digit(hours)}:{_TWO_DIGIT[minutes]}:{_TWO_DIGIT[seconds]}"
+    return _compile_fmt(fmt)(_two_digit(hours), _TWO_DIGIT[minutes], _TWO_DIGIT[seconds])
+
+
+# Matches "#PBS" directives and module/export/setenv commands, one line at a time
+_PBS_LINE_RE = re.compile(
+    r"^[ \t]*(?:#PBS -(?P<directive>\S+)[ \t]*(?P<options>.*)"
+    r"|(?P<keyword>module|export|setenv)(?:[ \t]+(?P<args>.*))?)$",
+    re.M,
+)
+
+
+def scan_pbs_script(pbs_body):
+    """
+    Parses the modules, environment variables and directives from pbs file contents.
+
+    Args:
+        pbs_body(str): contents of the PBS script.
+
+    Returns:
+        tuple: the modules and environment variables, and a dictionary of the directives.
+    """
+    modules_to_load = []
+    modules_to_unload = []
+    env_vars = {}
+    directives = {}
+    l_matches = []
+
+    for match in _PBS_LINE_RE.finditer(pbs_body):
+        directive, options, keyword, args = match.group("directive", "options", "keyword", "args")
+
+        if directive is not None:
+            directives[directive] = (options.split() + [""])[0]
+            # Collect l directives to be parsed into resources
+            if directive == "l" and options:
+                l_matches.append(options)
+            continue
+
+        args = args.split() if args else []
+
+        # Get modules
+        if keyword == "module" and len(args) > 1:
+            action, modules = args[0], args[1:]
+            if action == "load":
+                modules_to_load.extend(modules)
+            elif action == "unload":
+                modules_to_unload.extend(modules)
+            elif action == "swap" and len(modules) > 1:
+                modules_to_unload.append(modules[0])
+                modules_to_load.append(modules[1])
+
+        # Get environment variables from BASH scripts
+        elif keyword == "export" and args:
+            # Add environment variable, keeping everything to the right of the first equals sign
+            var_name, _, value = args[0].partition("=")
+            env_vars[var_name] = value
+
+        # Get environment variables from CSH scripts
+        elif keyword == "setenv" and len(args) > 1:
+            env_vars[args[0]] = args[1]
+
+    d = dict()
+    for match in l_matches:
+        if "walltime" in match:
+            d["walltime"] = match.partition("=")[2]
+            continue
+        for resource in match.split(":"):
+            k, _, v = resource.partition("=")
+            if k:
+                d[k] = v
+    directives["l"] = d
+
+    parsed_body = {
+        "modules_to_load": modules_to_load,
+        "modules_to_unload": modules_to_unload,
+        "environment_variables": env_vars,
+    }
+    return parsed_body, directives